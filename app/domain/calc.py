@@ -1,5 +1,8 @@
+from .money import to_cents, to_pesos
+
+
 def calcular_subtotal(precio, cantidad):
-    return round(float(precio) * int(cantidad), 2)
+    return to_pesos(to_cents(precio) * int(cantidad))
 
 def calcular_total(items):
-    return round(sum(float(item["subtotal"]) for item in items), 2)
+    return to_pesos(sum(to_cents(item["subtotal"]) for item in items))
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import unicodedata
+
+# Las subcadenas de hasta este largo se indexan completas; las más largas se
+# buscan intersectando sus trigramas y verificando al final.
+_GRAM = 3
+
+
+def normalizar(texto: str) -> str:
+    # Minúsculas y sin acentos: "Piña" y "pina" son la misma búsqueda
+    texto = unicodedata.normalize("NFKD", str(texto or "").lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def _grams(texto: str) -> set[str]:
+    grams = set()
+    for n in range(1, _GRAM + 1):
+        for i in range(len(texto) - n + 1):
+            grams.add(texto[i:i + n])
+    return grams
+
+
+class CatalogIndex:
+    """Índice de búsqueda del catálogo, armado una vez por carga de productos.
+
+    Sólo incluye productos activos, en el orden recibido. `buscar(q, cat)`
+    regresa las posiciones (ascendentes) de los productos donde cada palabra
+    de `q` aparece en el nombre o la categoría, sin distinguir acentos ni
+    mayúsculas, opcionalmente dentro de una categoría.
+    """
+
+    def __init__(self, productos: list[dict]):
+        self.productos: list[dict] = []
+        self.labels: list[str] = []
+        self._textos: list[tuple[str, str]] = []
+        # n-grama (1..3 letras) -> posiciones de los productos que lo contienen
+        self._postings: dict[str, set[int]] = {}
+        self._por_categoria: dict[str, list[int]] = {}
+
+        for p in productos:
+            if not p.get("activo", True):
+                continue
+            pos = len(self.productos)
+            cat = p.get("categoria", "GENERAL")
+            self.productos.append(p)
+            self.labels.append(f"[{cat}] {p['nombre']}  -  ${float(p['precio']):.2f}")
+            nombre_n, cat_n = normalizar(p["nombre"]), normalizar(cat)
+            self._textos.append((nombre_n, cat_n))
+            for g in _grams(nombre_n) | _grams(cat_n):
+                self._postings.setdefault(g, set()).add(pos)
+            self._por_categoria.setdefault(cat, []).append(pos)
+        self._todas = list(range(len(self.productos)))
+
+    @property
+    def categorias(self) -> list[str]:
+        return sorted(self._por_categoria)
+
+    def buscar(self, q: str, cat: str | None = None) -> list[int]:
+        base = self._todas if cat is None else self._por_categoria.get(cat, [])
+        palabras = normalizar(q).split()
+        if not palabras:
+            return list(base)
+
+        candidatos: set[int] | None = None
+        largas = []
+        for w in palabras:
+            if len(w) <= _GRAM:
+                grams = [w]
+            else:
+                grams = [w[i:i + _GRAM] for i in range(len(w) - _GRAM + 1)]
+                largas.append(w)
+            for g in grams:
+                hits = self._postings.get(g)
+                if not hits:
+                    return []
+                candidatos = set(hits) if candidatos is None else candidatos & hits
+                if not candidatos:
+                    return []
+
+        # Los trigramas pueden venir de campos o lugares distintos: las
+        # palabras largas se confirman contra el texto.
+        if largas:
+            candidatos = {
+                pos for pos in candidatos
+                if all(w in self._textos[pos][0] or w in self._textos[pos][1] for w in largas)
+            }
+        if cat is None:
+            return sorted(candidatos)
+        return [pos for pos in base if pos in candidatos]
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+from typing import Callable
+
+from .money import Cents, to_cents, to_pesos
+
+# Suscriptor: (evento, idx, línea). Eventos: "add", "update", "remove" y
+# "reset" (idx -1; la vista debe redibujar todo).
+Listener = Callable[[str, int, "ComandaLine | None"], None]
+
+_HEADER = ("folio_local", "created_at", "mesero", "mesa", "metodo", "propina", "recibido")
+
+
+class ComandaLine:
+    # Precio y subtotal se guardan en centavos; en pesos sólo al leerlos
+    __slots__ = ("producto_id", "nombre_snapshot", "precio_c", "cantidad", "subtotal_c")
+
+    def __init__(self, producto_id, nombre_snapshot: str, precio_unitario: float, cantidad: int, subtotal: float | None = None):
+        self.producto_id = producto_id
+        self.nombre_snapshot = nombre_snapshot
+        self.precio_c: Cents = to_cents(precio_unitario)
+        self.cantidad = int(cantidad)
+        self.subtotal_c: Cents = self.precio_c * self.cantidad if subtotal is None else to_cents(subtotal)
+
+    @property
+    def precio_unitario(self) -> float:
+        return to_pesos(self.precio_c)
+
+    @property
+    def subtotal(self) -> float:
+        return to_pesos(self.subtotal_c)
+
+    def to_dict(self) -> dict:
+        return {
+            "producto_id": self.producto_id,
+            "nombre_snapshot": self.nombre_snapshot,
+            "precio_unitario": self.precio_unitario,
+            "cantidad": self.cantidad,
+            "subtotal": self.subtotal,
+        }
+
+
+def _llave(line: ComandaLine) -> tuple:
+    return line.producto_id, line.precio_c
+
+
+class Comanda:
+    """Una comanda abierta: encabezado, líneas y total llevado al día.
+
+    Las líneas se modifican sólo con los métodos de la clase: cada uno ajusta
+    `total_c` (centavos) con la diferencia del subtotal, marca `dirty` (hay
+    algo sin guardar) y avisa a los suscriptores qué línea cambió. Agregar un
+    producto que ya está en la comanda al mismo precio suma a su línea; a
+    otro precio abre una línea aparte.
+    """
+
+    __slots__ = ("uid",) + _HEADER + ("lines", "total_c", "dirty", "_por_producto", "_listeners")
+
+    def __init__(
+        self,
+        uid: str | None = None,
+        folio_local: str | None = None,
+        created_at: str | None = None,
+        mesero: str = "",
+        mesa: str = "",
+        metodo: str = "EFECTIVO",
+        propina: str = "",
+        recibido: str = "",
+        lines: list[ComandaLine] | None = None,
+    ):
+        self.uid = uid
+        self.folio_local = folio_local
+        self.created_at = created_at
+        self.mesero = mesero
+        self.mesa = mesa
+        self.metodo = metodo
+        self.propina = propina
+        self.recibido = recibido
+        self.lines: list[ComandaLine] = lines or []
+        self.total_c: Cents = sum(line.subtotal_c for line in self.lines)
+        # (producto_id, precio en centavos) -> línea a la que suma `add`: la
+        # misma regla de fusión. Con repetidas (comandas viejas) gana la primera.
+        self._por_producto: dict[tuple, ComandaLine] = {}
+        for line in self.lines:
+            self._por_producto.setdefault(_llave(line), line)
+        self._listeners: list[Listener] = []
+        # Una comanda nueva aún no está guardada
+        self.dirty = True
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Comanda:
+        lines = [
+            ComandaLine(it.get("producto_id"), it.get("nombre_snapshot"), it.get("precio_unitario") or 0,
+                        it.get("cantidad") or 0, it.get("subtotal"))
+            for it in data.get("items") or []
+        ]
+        c = cls(
+            uid=data.get("uid"),
+            folio_local=data.get("folio_local"),
+            created_at=data.get("created_at"),
+            mesero=data.get("mesero") or "",
+            mesa=data.get("mesa") or "",
+            metodo=data.get("metodo") or "EFECTIVO",
+            propina=data.get("propina") or "",
+            recibido=data.get("recibido") or "",
+            lines=lines,
+        )
+        c.dirty = False
+        return c
+
+    @property
+    def total(self) -> float:
+        return to_pesos(self.total_c)
+
+    def to_dict(self) -> dict:
+        data = {k: getattr(self, k) for k in _HEADER}
+        data["uid"] = self.uid
+        data["items"] = self.item_dicts()
+        return data
+
+    def item_dicts(self) -> list[dict]:
+        # Formato de items que esperan guardar_comanda y el almacén local
+        return [line.to_dict() for line in self.lines]
+
+    def subscribe(self, listener: Listener) -> None:
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Listener) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def set_header(self, **fields) -> None:
+        for k, v in fields.items():
+            if getattr(self, k) != v:
+                setattr(self, k, v)
+                self.dirty = True
+
+    def add(self, producto_id, nombre_snapshot: str, precio_unitario: float, cantidad: int) -> int:
+        line = self._por_producto.get((producto_id, to_cents(precio_unitario)))
+        if line is not None:
+            idx = self.lines.index(line)
+            self.set_cantidad(idx, line.cantidad + int(cantidad))
+            return idx
+        line = ComandaLine(producto_id, nombre_snapshot, precio_unitario, cantidad)
+        self.lines.append(line)
+        self._por_producto[_llave(line)] = line
+        self.total_c += line.subtotal_c
+        self.dirty = True
+        idx = len(self.lines) - 1
+        self._emit("add", idx, line)
+        return idx
+
+    def set_cantidad(self, idx: int, cantidad: int) -> None:
+        # Cantidad <= 0 quita la línea
+        if cantidad <= 0:
+            self.remove(idx)
+            return
+        line = self.lines[idx]
+        antes = line.subtotal_c
+        line.cantidad = int(cantidad)
+        line.subtotal_c = line.precio_c * line.cantidad
+        self.total_c += line.subtotal_c - antes
+        self.dirty = True
+        self._emit("update", idx, line)
+
+    def remove(self, idx: int) -> None:
+        line = self.lines.pop(idx)
+        llave = _llave(line)
+        if self._por_producto.get(llave) is line:
+            # Si queda otra línea con la misma llave, ésa recibe lo que se agregue
+            otra = next((l for l in self.lines if _llave(l) == llave), None)
+            if otra is None:
+                del self._por_producto[llave]
+            else:
+                self._por_producto[llave] = otra
+        self.total_c -= line.subtotal_c
+        self.dirty = True
+        self._emit("remove", idx, line)
+
+    def clear(self) -> None:
+        self.lines = []
+        self._por_producto = {}
+        self.total_c = 0
+        self.dirty = True
+        self._emit("reset", -1, None)
+
+    def _emit(self, evento: str, idx: int, line: ComandaLine | None) -> None:
+        for listener in self._listeners:
+            listener(evento, idx, line)
@@ -1,24 +1,32 @@
-def _round2(value: float) -> float:
-    return round(float(value), 2)
+from .money import Cents, to_cents, to_pesos
+
+METODOS = ("EFECTIVO", "TARJETA", "TRANSFER")
+
+
+def resumen_por_metodo(por_metodo: dict[str, Cents]) -> dict[str, Cents]:
+    # {metodo: centavos} -> los tres métodos conocidos más "total"
+    resumen = dict.fromkeys(METODOS + ("total",), 0)
+    for metodo, cents in por_metodo.items():
+        if metodo in METODOS:
+            resumen[metodo] += cents
+        resumen["total"] += cents
+    return resumen
 
 
 def calc_ventas_por_metodo(rows: list[dict]) -> dict:
-    resumen = {"EFECTIVO": 0.0, "TARJETA": 0.0, "TRANSFER": 0.0, "total": 0.0}
+    resumen = dict.fromkeys(METODOS + ("total",), 0)
     for r in rows:
-        total = float(r.get("total") or 0)
+        cents = to_cents(r.get("total"))
         metodo = r.get("metodo_pago") or ""
-        if metodo in resumen:
-            resumen[metodo] += total
-        resumen["total"] += total
-
-    for k in ("EFECTIVO", "TARJETA", "TRANSFER", "total"):
-        resumen[k] = _round2(resumen[k])
-    return resumen
+        if metodo in METODOS:
+            resumen[metodo] += cents
+        resumen["total"] += cents
+    return {k: to_pesos(v) for k, v in resumen.items()}
 
 
 def calc_efectivo_teorico(ventas_efectivo: float, gastos_total: float, propinas_total: float) -> float:
-    return _round2(float(ventas_efectivo) - float(gastos_total) - float(propinas_total))
+    return to_pesos(to_cents(ventas_efectivo) - to_cents(gastos_total) - to_cents(propinas_total))
 
 
 def calc_diferencia(efectivo_reportado: float, efectivo_teorico: float) -> float:
-    return _round2(float(efectivo_reportado) - float(efectivo_teorico))
+    return to_pesos(to_cents(efectivo_reportado) - to_cents(efectivo_teorico))
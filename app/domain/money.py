@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+# Dinero en centavos enteros. Un monto (float, int o el texto con que
+# PostgREST regresa un numeric) se convierte una vez con to_cents, se suma
+# como int, sin error acumulado, y vuelve a pesos con to_pesos sólo al
+# mostrarlo, guardarlo o mandarlo.
+Cents = int
+
+
+def to_cents(value) -> Cents:
+    if value is None or value == "":
+        return 0
+    if isinstance(value, int):
+        return value * 100
+    # Los montos traen a lo más 2 decimales: el error de float(x) * 100 es
+    # mucho menor a medio centavo y round() da el entero exacto.
+    return round(float(value) * 100)
+
+
+def to_pesos(cents: Cents) -> float:
+    # int / 100 da el float más cercano: 1999 -> 19.99, sin arrastrar error
+    return cents / 100
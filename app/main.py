@@ -1,12 +1,17 @@
-import json
 import os
+import queue
 from datetime import datetime
 import tkinter as tk
 from tkinter import ttk, messagebox
 import customtkinter as ctk
 
-from services.supabase_service import SupabaseService
-from domain.calc import calcular_subtotal, calcular_total
+from services.comandas_store import ComandasStore
+from services.ids import uuid7
+from services.registry import get_service
+from services.sync_worker import SyncWorker
+from domain.catalogo import CatalogIndex
+from domain.comanda import Comanda, ComandaLine
+from domain.money import to_cents, to_pesos
 from ui.assets import load_logo
 from ui.gastos_dialog import GastosDialog
 from ui.propinas_dialog import PropinasDialog
@@ -15,6 +20,11 @@ from ui.reportes_view import ReportesView
 from ui.personal_dialog import PersonalDialog
 from ui.productos_dialog import ProductosDialog
 
+# Espera tras la última tecla antes de filtrar el catálogo
+_SEARCH_DEBOUNCE_MS = 120
+# Los cambios a comandas abiertas se juntan y se escriben a lo más cada tanto
+_PERSIST_DELAY_MS = 300
+
 
 class POSApp(tk.Tk):
     def __init__(self):
@@ -42,13 +52,24 @@ class POSApp(tk.Tk):
         style.configure("Section.TLabel", font=("Arial", 12, "bold"))
         style.configure("Total.TLabel", font=("Arial", 18, "bold"))
 
-        self.db = SupabaseService()
+        self.db = get_service()
         self.productos = self.db.get_productos()
+        self.catalogo = CatalogIndex(self.productos)
+        self.filtered = []
+        self._catalog_shown: list[int] = []  # posiciones del índice visibles en prod_list
+        self._catalog_query: tuple[str, str] | None = None
+        self._search_after_id = None
 
-        self.items = []  # dict: producto_id, nombre_snapshot, precio_unitario, cantidad, subtotal
+        self.ticket = Comanda()  # comanda activa (referencia a un elemento de self.comandas)
+        self._ticket_iids: list[str] = []  # iid del Treeview por línea, en orden
+        self._ticket_seq = 0
         self.comandas = []
         self.active_comanda = None
-        self._comandas_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "data", "comandas_abiertas.json"))
+        base_dir = os.path.abspath(os.path.dirname(__file__))
+        self.comandas_store = ComandasStore(base_dir)
+        self._persist_after_id = None
+        # Formato anterior; sólo se lee una vez para migrarlo a comandas.db
+        self._comandas_path = os.path.join(base_dir, "data", "comandas_abiertas.json")
 
         self._build_ui()
         self.after(100, lambda: self.mesero_menu.focus_set())
@@ -56,7 +77,7 @@ class POSApp(tk.Tk):
         self._refresh_catalog()
         self._bind_shortcuts()
         self._tick_clock()
-        self._sync_loop()
+        self._start_sync_worker()
 
     # ---------------- UI ----------------
     def _build_ui(self):
@@ -101,6 +122,8 @@ class POSApp(tk.Tk):
 
         self.clock_var = tk.StringVar()
         tk.Label(right_top, textvariable=self.clock_var, fg="#e5e7eb", bg="#1f2937", font=("Arial", 10, "bold")).pack(anchor="e", pady=(6, 0))
+        self.sync_var = tk.StringVar(value="Sync: iniciando...")
+        tk.Label(right_top, textvariable=self.sync_var, fg="#9ca3af", bg="#1f2937", font=("Arial", 9)).pack(anchor="e")
         ttk.Button(right_top, text="Salir", style="Danger.TButton", command=self._exit_app).pack(anchor="e", pady=(6, 0))
 
         # Main split
@@ -153,12 +176,11 @@ class POSApp(tk.Tk):
         self.search_var = tk.StringVar()
         self.search_entry = ttk.Entry(left, textvariable=self.search_var, width=30)
         self.search_entry.pack(fill="x", pady=(6, 6))
-        self.search_entry.bind("<KeyRelease>", lambda _e: self._refresh_catalog())
+        self.search_entry.bind("<KeyRelease>", lambda _e: self._schedule_catalog_refresh())
         self.search_entry.bind("<Return>", lambda _e: self._focus_catalog())
 
-        cats = sorted({p.get("categoria", "GENERAL") for p in self.productos})
         self.cat_var = tk.StringVar(value="TODAS")
-        cat_values = ["TODAS"] + cats
+        cat_values = ["TODAS"] + self.catalogo.categorias
         self.cat_menu = ttk.Combobox(left, textvariable=self.cat_var, values=cat_values, state="readonly")
         self.cat_menu.pack(fill="x", pady=(0, 8))
         self.cat_menu.bind("<<ComboboxSelected>>", lambda _e: self._refresh_catalog())
@@ -211,6 +233,8 @@ class POSApp(tk.Tk):
         self.tree.column("unit", width=110, anchor="center")
         self.tree.column("sub", width=120, anchor="center")
 
+        self.tree.tag_configure("even", background="#ffffff")
+        self.tree.tag_configure("odd", background="#f3f4f6")
         self.tree.pack(fill="both", expand=True)
         self.tree.bind("<Delete>", lambda _e: self._remove_selected())
         self.tree.bind("<plus>", lambda _e: self._inc_selected())
@@ -281,15 +305,43 @@ class POSApp(tk.Tk):
         self.bind_all("<Control-l>", lambda _e: self._clear_all())
         self.bind_all("<Control-q>", lambda _e: self._exit_app())
 
-    def _sync_loop(self):
+    def _start_sync_worker(self):
+        # El sync corre en su propio hilo; aquí sólo se lee su cola de estado
+        self.sync_worker = SyncWorker()
+        self.sync_worker.start()
+        # Drenar de inmediato al encolar algo o cuando la UI detecta que volvió la red
+        self.db.offline.on_enqueue = self.sync_worker.wake
+        self.db.health.on_close = self.sync_worker.wake
+        self._poll_sync_status()
+
+    def _poll_sync_status(self):
+        status = None
         try:
-            self.db.sync_offline()
-            self.db.offline.daily_backup(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-        except Exception:
+            while True:
+                status = self.sync_worker.status.get_nowait()
+        except queue.Empty:
             pass
-        self.after(30000, self._sync_loop)
+        if status is not None:
+            self._render_sync_status(status)
+        self.after(500, self._poll_sync_status)
+
+    def _render_sync_status(self, status: dict):
+        pending = status.get("pending")
+        parts = [f"Sync: {pending} pendientes" if pending is not None else "Sync: -"]
+        if pending and status.get("lag_seconds"):
+            parts.append(f"atraso {int(status['lag_seconds'] // 60)} min")
+        if status.get("last_success"):
+            parts.append(f"ok {status['last_success'].strftime('%H:%M:%S')}")
+        if status.get("dead_letter"):
+            parts.append(f"{status['dead_letter']} rechazadas")
+        if status.get("last_error"):
+            parts.append("error")
+        self.sync_var.set(" | ".join(parts))
+
     def _exit_app(self):
         if messagebox.askyesno("Salir", "¿Cerrar el POS?"):
+            self._flush_comandas()
+            self.sync_worker.stop()
             self.destroy()
 
     def _tick_clock(self):
@@ -297,57 +349,57 @@ class POSApp(tk.Tk):
         self.after(1000, self._tick_clock)
 
     def _focus_catalog(self):
+        # Enter antes de que venza el debounce: filtrar ya con lo tecleado
+        if self._search_after_id is not None:
+            self._refresh_catalog()
         if self.prod_list.size() > 0:
             if not self.prod_list.curselection():
                 self.prod_list.selection_set(0)
             self.prod_list.activate(0)
         self.prod_list.focus_set()
 
-    def _comanda_snapshot(self) -> dict:
-        return {
-            "folio_local": self.comandas[self.active_comanda].get("folio_local") if self.active_comanda is not None else None,
-            "created_at": self.comandas[self.active_comanda].get("created_at") if self.active_comanda is not None else None,
-            "mesero": self.mesero_var.get().strip(),
-            "mesa": self.mesa_var.get().strip(),
-            "metodo": self.metodo_var.get(),
-            "propina": self.propina_var.get().strip(),
-            "recibido": self.recibido_var.get().strip(),
-            "items": [it.copy() for it in self.items],
-        }
-
-    def _apply_snapshot(self, snap: dict):
-        self.mesero_var.set(snap.get("mesero", ""))
-        self.mesa_var.set(snap.get("mesa", ""))
-        self.metodo_var.set(snap.get("metodo", "EFECTIVO"))
-        self.propina_var.set(snap.get("propina", ""))
-        self.recibido_var.set(snap.get("recibido", ""))
-        self.items = [it.copy() for it in snap.get("items", [])]
+    def _sync_header(self):
+        # Pasa los campos de cobro a la comanda activa (dirty sólo si cambian)
+        self.ticket.set_header(
+            mesero=self.mesero_var.get().strip(),
+            mesa=self.mesa_var.get().strip(),
+            metodo=self.metodo_var.get(),
+            propina=self.propina_var.get().strip(),
+            recibido=self.recibido_var.get().strip(),
+        )
+
+    def _show_comanda(self, idx: int):
+        # Cambiar de mesa sólo cambia la referencia activa: no se copian líneas
+        self.ticket.unsubscribe(self._on_ticket_event)
+        self.active_comanda = idx
+        self.ticket = self.comandas[idx]
+        self.ticket.subscribe(self._on_ticket_event)
+        self.mesero_var.set(self.ticket.mesero)
+        self.mesa_var.set(self.ticket.mesa)
+        self.metodo_var.set(self.ticket.metodo)
+        self.propina_var.set(self.ticket.propina)
+        self.recibido_var.set(self.ticket.recibido)
+        self._on_ticket_event("reset", -1, None)
         self._toggle_cash_fields()
-        self._refresh_ticket()
 
     def _save_current_to_state(self):
         if self.active_comanda is None:
             return
-        self.comandas[self.active_comanda] = self._comanda_snapshot()
-        self._update_comandas_list()
+        self._sync_header()
+        self._update_comanda_row(self.active_comanda)
         self._persist_comandas()
 
     def _new_comanda(self):
         if self.active_comanda is not None:
             self._save_current_to_state()
-        default_mesa = self._next_mesa_default()
-        self.comandas.append({
-            "folio_local": f"TMP-{datetime.now().strftime('%H%M%S')}",
-            "created_at": datetime.now().isoformat(timespec="seconds"),
-            "mesero": self.mesero_var.get().strip(),
-            "mesa": default_mesa,
-            "metodo": "EFECTIVO",
-            "propina": "",
-            "recibido": "",
-            "items": [],
-        })
-        self.active_comanda = len(self.comandas) - 1
-        self._apply_snapshot(self.comandas[self.active_comanda])
+        self.comandas.append(Comanda(
+            uid=uuid7(),
+            folio_local=f"TMP-{datetime.now().strftime('%H%M%S')}",
+            created_at=datetime.now().isoformat(timespec="seconds"),
+            mesero=self.mesero_var.get().strip(),
+            mesa=self._next_mesa_default(),
+        ))
+        self._show_comanda(len(self.comandas) - 1)
         self._update_comandas_list()
         self._persist_comandas()
 
@@ -359,20 +411,23 @@ class POSApp(tk.Tk):
         if idx == self.active_comanda:
             return
         self._save_current_to_state()
-        self.active_comanda = idx
-        self._apply_snapshot(self.comandas[idx])
+        self._show_comanda(idx)
+        self._update_comandas_list()
         self._persist_comandas()
 
+    def _comanda_label(self, i: int) -> str:
+        # El total de cada comanda ya está calculado: listar no vuelve a sumar
+        c = self.comandas[i]
+        mesero = c.mesero or "Sin mesero"
+        mesa = c.mesa or "-"
+        folio = c.folio_local or f"{i+1}"
+        marker = "*" if i == self.active_comanda else " "
+        return f"{marker} {folio} | Mesa {mesa} - {mesero} - ${c.total:.2f}"
+
     def _update_comandas_list(self):
         self.comandas_list.delete(0, tk.END)
-        for i, c in enumerate(self.comandas):
-            total = calcular_total(c.get("items", [])) if c.get("items") else 0.0
-            mesero = c.get("mesero") or "Sin mesero"
-            mesa = c.get("mesa") or "-"
-            folio = c.get("folio_local") or f"{i+1}"
-            marker = "*" if i == self.active_comanda else " "
-            label = f"{marker} {folio} | Mesa {mesa} - {mesero} - ${total:.2f}"
-            self.comandas_list.insert(tk.END, label)
+        for i in range(len(self.comandas)):
+            self.comandas_list.insert(tk.END, self._comanda_label(i))
             bg = "#ffffff" if i % 2 == 0 else "#f3f4f6"
             self.comandas_list.itemconfig(i, bg=bg)
         if self.active_comanda is not None and self.comandas_list.size() > 0:
@@ -380,11 +435,23 @@ class POSApp(tk.Tk):
             self.comandas_list.selection_set(self.active_comanda)
             self.comandas_list.activate(self.active_comanda)
 
+    def _update_comanda_row(self, i: int):
+        # Sólo cambió una comanda: se reescribe su renglón y no la lista entera
+        if not (0 <= i < self.comandas_list.size()):
+            self._update_comandas_list()
+            return
+        self.comandas_list.delete(i)
+        self.comandas_list.insert(i, self._comanda_label(i))
+        self.comandas_list.itemconfig(i, bg="#ffffff" if i % 2 == 0 else "#f3f4f6")
+        if i == self.active_comanda:
+            self.comandas_list.selection_set(i)
+            self.comandas_list.activate(i)
+
     def _next_mesa_default(self) -> str:
         # Busca el último número de mesa usado y suma 1
         last = 0
         for c in self.comandas:
-            mesa = str(c.get("mesa") or "").strip()
+            mesa = str(c.mesa or "").strip()
             if mesa.isdigit():
                 last = max(last, int(mesa))
         return str(last + 1) if last else "1"
@@ -394,69 +461,122 @@ class POSApp(tk.Tk):
             return
         if not messagebox.askyesno("Cerrar comanda", "¿Descartar esta comanda sin guardar?"):
             return
-        self.comandas.pop(self.active_comanda)
+        self._drop_active_comanda()
         if self.comandas:
-            self.active_comanda = min(self.active_comanda, len(self.comandas) - 1)
-            self._apply_snapshot(self.comandas[self.active_comanda])
+            self._update_comandas_list()
         else:
-            self.active_comanda = None
-            self.items = []
-            self._refresh_ticket()
             self._new_comanda()
         self._persist_comandas()
 
+    def _drop_active_comanda(self):
+        # Quita la comanda activa (y de la base) y muestra la más cercana
+        self.comandas_store.delete(self.comandas.pop(self.active_comanda).uid)
+        if self.comandas:
+            self._show_comanda(min(self.active_comanda, len(self.comandas) - 1))
+        else:
+            self.active_comanda = None
+
     def _persist_comandas(self):
-        data = {
-            "active_index": self.active_comanda,
-            "comandas": self.comandas,
-        }
+        # Marca la activa y agenda un flush: varios cambios seguidos se
+        # escriben juntos.
+        uid = self.ticket.uid if self.active_comanda is not None else None
+        self.comandas_store.set_activa(uid)
+        if self._persist_after_id is None:
+            self._persist_after_id = self.after(_PERSIST_DELAY_MS, self._flush_comandas)
+
+    def _flush_comandas(self):
+        if self._persist_after_id is not None:
+            self.after_cancel(self._persist_after_id)
+            self._persist_after_id = None
+        # Sólo las comandas con cambios (dirty) se pasan al almacén
+        for c in self.comandas:
+            if c.dirty:
+                self.comandas_store.put(c.to_dict())
+                c.dirty = False
         try:
-            os.makedirs(os.path.dirname(self._comandas_path), exist_ok=True)
-            with open(self._comandas_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False)
+            self.comandas_store.flush()
         except Exception:
+            # Lo pendiente se conserva y sale en el siguiente flush
             pass
 
     def _load_comandas(self):
         try:
-            with open(self._comandas_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            self.comandas = data.get("comandas") or []
-            self.active_comanda = data.get("active_index")
+            self.comandas_store.migrate_json(self._comandas_path)
+            data, activa = self.comandas_store.load()
         except Exception:
-            self.comandas = []
-            self.active_comanda = None
+            data, activa = [], None
+        self.comandas = [Comanda.from_dict(d) for d in data]
 
         if not self.comandas:
             self._new_comanda()
             return
 
-        if self.active_comanda is None or not (0 <= self.active_comanda < len(self.comandas)):
-            self.active_comanda = 0
-        self._apply_snapshot(self.comandas[self.active_comanda])
+        uids = [c.uid for c in self.comandas]
+        self._show_comanda(uids.index(activa) if activa in uids else 0)
         self._update_comandas_list()
 
+    def _schedule_catalog_refresh(self):
+        # Cada tecla reinicia la espera: escribir "barbacoa" filtra una vez
+        if self._search_after_id is not None:
+            self.after_cancel(self._search_after_id)
+        self._search_after_id = self.after(_SEARCH_DEBOUNCE_MS, self._refresh_catalog)
+
     def _refresh_catalog(self):
-        q = self.search_var.get().strip().lower()
+        if self._search_after_id is not None:
+            self.after_cancel(self._search_after_id)
+            self._search_after_id = None
+        q = self.search_var.get().strip()
         cat = self.cat_var.get()
-
-        self.filtered = []
-        self.prod_list.delete(0, tk.END)
-
-        for p in self.productos:
-            if not p.get("activo", True):
-                continue
-            pcat = p.get("categoria", "GENERAL")
-            if cat != "TODAS" and pcat != cat:
+        # Flechas, Shift, etc. también disparan KeyRelease sin cambiar nada
+        if (q, cat) == self._catalog_query:
+            return
+        self._catalog_query = (q, cat)
+
+        shown = self.catalogo.buscar(q, None if cat == "TODAS" else cat)
+        self._sync_prod_list(shown)
+        self.filtered = [self.catalogo.productos[pos] for pos in shown]
+
+    def _sync_prod_list(self, shown: list[int]):
+        # Ambas listas van en orden del índice: se borran las filas que salen
+        # y se insertan las que entran, sin reconstruir el Listbox completo.
+        old = self._catalog_shown
+        keep = set(shown)
+        first_change = None
+
+        end = len(old)
+        while end > 0:
+            if old[end - 1] in keep:
+                end -= 1
                 continue
-            label = f"[{pcat}] {p['nombre']}  -  ${float(p['precio']):.2f}"
-            if q and (q not in p["nombre"].lower()) and (q not in pcat.lower()):
+            start = end - 1
+            while start > 0 and old[start - 1] not in keep:
+                start -= 1
+            self.prod_list.delete(start, end - 1)
+            first_change = start
+            end = start
+
+        kept = [pos for pos in old if pos in keep]
+        k = 0
+        j = 0
+        while j < len(shown):
+            if k < len(kept) and kept[k] == shown[j]:
+                k += 1
+                j += 1
                 continue
-            self.filtered.append(p)
-            self.prod_list.insert(tk.END, label)
-            idx = self.prod_list.size() - 1
-            bg = "#ffffff" if idx % 2 == 0 else "#f3f4f6"
-            self.prod_list.itemconfig(idx, bg=bg)
+            run_end = j
+            while run_end < len(shown) and not (k < len(kept) and kept[k] == shown[run_end]):
+                run_end += 1
+            self.prod_list.insert(j, *(self.catalogo.labels[pos] for pos in shown[j:run_end]))
+            if first_change is None or j < first_change:
+                first_change = j
+            j = run_end
+
+        self._catalog_shown = list(shown)
+        if first_change is None:
+            return
+        # El zebra depende del índice visible: sólo cambia desde la primera fila movida
+        for idx in range(first_change, len(shown)):
+            self.prod_list.itemconfig(idx, bg="#ffffff" if idx % 2 == 0 else "#f3f4f6")
 
     def _add_selected_product(self):
         sel = self.prod_list.curselection()
@@ -472,81 +592,72 @@ class POSApp(tk.Tk):
             messagebox.showwarning("Cantidad inválida", "Cantidad debe ser entero > 0.")
             return
 
-        unit = float(p["precio"])
-        sub = calcular_subtotal(unit, qty)
-        self.items.append({
-            "producto_id": p["id"],
-            "nombre_snapshot": p["nombre"],
-            "precio_unitario": unit,
-            "cantidad": qty,
-            "subtotal": sub,
-        })
-        self._refresh_ticket()
+        # Si el producto ya está en la comanda se suma a su línea
+        self.ticket.add(p["id"], p["nombre"], float(p["precio"]), qty)
         self._save_current_to_state()
 
-    def _refresh_ticket(self):
-        for row in self.tree.get_children():
-            self.tree.delete(row)
-        for idx, it in enumerate(self.items):
-            tag = "even" if idx % 2 == 0 else "odd"
-            self.tree.insert(
-                "", "end", iid=str(idx),
-                values=("[-]", it["cantidad"], "[+]", it["nombre_snapshot"],
-                        f"${float(it['precio_unitario']):.2f}",
-                        f"${float(it['subtotal']):.2f}")
-                , tags=(tag,)
-            )
-        self.tree.tag_configure("even", background="#ffffff")
-        self.tree.tag_configure("odd", background="#f3f4f6")
-        total = calcular_total(self.items) if self.items else 0.0
-        self.total_var.set(f"${total:.2f}")
+    def _on_ticket_event(self, evento: str, idx: int, line: ComandaLine | None):
+        # La comanda avisa qué línea cambió: se toca sólo ese iid del Treeview
+        if evento == "reset":
+            self.tree.delete(*self.tree.get_children())
+            self._ticket_iids = []
+            for i, ln in enumerate(self.ticket.lines):
+                self._ticket_iids.append(self._insert_ticket_row(i, ln))
+        elif evento == "add":
+            self._ticket_iids.append(self._insert_ticket_row(idx, line))
+        elif evento == "update":
+            self.tree.item(self._ticket_iids[idx], values=self._ticket_values(line))
+        elif evento == "remove":
+            self.tree.delete(self._ticket_iids.pop(idx))
+            # Las filas de abajo suben una posición y cambian de color
+            for i in range(idx, len(self._ticket_iids)):
+                self.tree.item(self._ticket_iids[i], tags=("even" if i % 2 == 0 else "odd",))
+        self.total_var.set(f"${self.ticket.total:.2f}")
         self._update_change()
-        self._update_comandas_list()
 
-    def _remove_selected(self):
+    def _ticket_values(self, line: ComandaLine) -> tuple:
+        return ("[-]", line.cantidad, "[+]", line.nombre_snapshot,
+                f"${line.precio_unitario:.2f}",
+                f"${line.subtotal:.2f}")
+
+    def _insert_ticket_row(self, idx: int, line: ComandaLine) -> str:
+        # iid estable por línea: no cambia al borrar otras líneas
+        self._ticket_seq += 1
+        iid = f"L{self._ticket_seq}"
+        self.tree.insert("", "end", iid=iid, values=self._ticket_values(line),
+                         tags=("even" if idx % 2 == 0 else "odd",))
+        return iid
+
+    def _selected_line(self) -> int | None:
         sel = self.tree.selection()
-        if not sel:
-            return
-        idx = int(sel[0])
-        if 0 <= idx < len(self.items):
-            self.items.pop(idx)
-            self._refresh_ticket()
+        if not sel or sel[0] not in self._ticket_iids:
+            return None
+        return self._ticket_iids.index(sel[0])
+
+    def _remove_selected(self):
+        idx = self._selected_line()
+        if idx is not None:
+            self.ticket.remove(idx)
             self._save_current_to_state()
 
     def _clear_all(self):
-        self.items = []
-        self._refresh_ticket()
+        self.ticket.clear()
         if hasattr(self, "propina_var"):
             self.propina_var.set("")
         self.mesero_menu.focus_set()
         self._save_current_to_state()
 
     def _inc_selected(self):
-        sel = self.tree.selection()
-        if not sel:
-            return
-        idx = int(sel[0])
-        if 0 <= idx < len(self.items):
-            it = self.items[idx]
-            it["cantidad"] = int(it["cantidad"]) + 1
-            it["subtotal"] = calcular_subtotal(it["precio_unitario"], it["cantidad"])
-            self._refresh_ticket()
+        idx = self._selected_line()
+        if idx is not None:
+            self.ticket.set_cantidad(idx, self.ticket.lines[idx].cantidad + 1)
             self._save_current_to_state()
 
     def _dec_selected(self):
-        sel = self.tree.selection()
-        if not sel:
-            return
-        idx = int(sel[0])
-        if 0 <= idx < len(self.items):
-            it = self.items[idx]
-            qty = int(it["cantidad"]) - 1
-            if qty <= 0:
-                self.items.pop(idx)
-            else:
-                it["cantidad"] = qty
-                it["subtotal"] = calcular_subtotal(it["precio_unitario"], it["cantidad"])
-            self._refresh_ticket()
+        idx = self._selected_line()
+        if idx is not None:
+            # Llegar a 0 quita la línea
+            self.ticket.set_cantidad(idx, self.ticket.lines[idx].cantidad - 1)
             self._save_current_to_state()
 
     def _on_tree_click(self, event):
@@ -568,13 +679,12 @@ class POSApp(tk.Tk):
         # Solo editar cantidad (columna Cant = #2)
         if col != "#2":
             return
-        idx = int(row_id)
-        if not (0 <= idx < len(self.items)):
+        if row_id not in self._ticket_iids:
             return
-        it = self.items[idx]
+        line = self.ticket.lines[self._ticket_iids.index(row_id)]
 
         editor = ttk.Entry(self.tree)
-        editor.insert(0, str(it.get("cantidad", "")))
+        editor.insert(0, str(line.cantidad))
         editor.select_range(0, tk.END)
         editor.focus_set()
 
@@ -586,10 +696,11 @@ class POSApp(tk.Tk):
             except Exception:
                 editor.destroy()
                 return
-            it["cantidad"] = qty
-            it["subtotal"] = calcular_subtotal(it["precio_unitario"], it["cantidad"])
             editor.destroy()
-            self._refresh_ticket()
+            # La línea pudo moverse mientras se editaba: se busca por su iid
+            if row_id not in self._ticket_iids:
+                return
+            self.ticket.set_cantidad(self._ticket_iids.index(row_id), qty)
             self._save_current_to_state()
 
         def _cancel(_e=None):
@@ -613,26 +724,25 @@ class POSApp(tk.Tk):
     def _update_change(self):
         if self.metodo_var.get() != "EFECTIVO":
             return
-        total = calcular_total(self.items) if self.items else 0.0
         txt = self.recibido_var.get().strip()
         if not txt:
             self.cambio_var.set("0.00")
             return
         try:
-            recibido = float(txt)
+            recibido_c = to_cents(float(txt))
         except Exception:
             self.cambio_var.set("0.00")
             return
-        self.cambio_var.set(f"{(recibido - total):.2f}")
+        self.cambio_var.set(f"{to_pesos(recibido_c - self.ticket.total_c):.2f}")
 
     def _save_comanda(self):
-        if not self.items:
+        if not self.ticket.lines:
             messagebox.showwarning("Comanda vacía", "Agrega productos antes de guardar.")
             return
 
         mesero = self.mesero_var.get().strip() or "Sin nombre"
         metodo = self.metodo_var.get()
-        total = calcular_total(self.items)
+        total = self.ticket.total
 
         propina_txt = (self.propina_var.get().strip() if hasattr(self, "propina_var") else "")
         propina = 0.0
@@ -654,29 +764,25 @@ class POSApp(tk.Tk):
             except Exception:
                 messagebox.showwarning("Recibido inválido", "Escribe cuánto recibiste.")
                 return
-            if recibido < total:
+            if to_cents(recibido) < self.ticket.total_c:
                 messagebox.showwarning("Insuficiente", "El recibido debe ser >= total.")
                 return
-            cambio = recibido - total
+            cambio = to_pesos(to_cents(recibido) - self.ticket.total_c)
 
         try:
-            result = self.db.guardar_comanda(mesero, metodo, total, recibido, cambio, self.items, propina)
+            result = self.db.guardar_comanda(mesero, metodo, total, recibido, cambio, self.ticket.item_dicts(), propina)
             if result.get("offline"):
                 messagebox.showinfo("OK", f"Comanda guardada localmente.\nTotal: ${total:.2f}\nMétodo: {metodo}")
             else:
                 messagebox.showinfo("OK", f"Comanda guardada.\nTotal: ${total:.2f}\nMétodo: {metodo}")
             # Cerrar comanda actual y abrir una nueva
             if self.active_comanda is not None:
-                self.comandas.pop(self.active_comanda)
-                if self.comandas:
-                    self.active_comanda = min(self.active_comanda, len(self.comandas) - 1)
-                    self._apply_snapshot(self.comandas[self.active_comanda])
-                else:
-                    self.active_comanda = None
-                    self.items = []
-                    self._refresh_ticket()
+                self._drop_active_comanda()
             self._persist_comandas()
             self._new_comanda()
+            # La venta ya se registró: su comanda abierta se borra de inmediato
+            # para que un apagón no la resucite y se cobre dos veces.
+            self._flush_comandas()
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo guardar en Supabase:\n{e}")
 
@@ -702,6 +808,15 @@ class POSApp(tk.Tk):
         dlg = ProductosDialog(self, self.db)
         self.wait_window(dlg)
         self.productos = self.db.get_productos()
+        # Catálogo nuevo: índice nuevo y el Listbox se vuelve a llenar completo
+        self.catalogo = CatalogIndex(self.productos)
+        cat_values = ["TODAS"] + self.catalogo.categorias
+        self.cat_menu.configure(values=cat_values)
+        if self.cat_var.get() not in cat_values:
+            self.cat_var.set("TODAS")
+        self.prod_list.delete(0, tk.END)
+        self._catalog_shown = []
+        self._catalog_query = None
         self._refresh_catalog()
 
     def _refresh_meseros_dropdown(self):
@@ -1,7 +1,7 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 
-from services.supabase_service import SupabaseService
+from services.registry import get_service
 from domain.calc import calcular_subtotal, calcular_total
 
 
@@ -21,7 +21,7 @@ class POSApp(tk.Tk):
         style.configure("Treeview.Heading", font=("Arial", 11, "bold"))
         style.configure("Treeview", rowheight=28, font=("Arial", 10))
 
-        self.db = SupabaseService()
+        self.db = get_service()
         self.productos = self.db.get_productos()
 
         self.items = []  # dict: producto_id, nombre_snapshot, precio_unitario, cantidad, subtotal
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import glob
+import gzip
+import json
+import os
+import threading
+import zlib
+from datetime import date, datetime
+from typing import Iterator
+
+_PREFIX = "journal_"
+_SUFFIX = ".ndjson.gz"
+
+
+class BackupJournal:
+    """Bitácora append-only de todo lo que entra a la cola offline.
+
+    Cada operación se escribe una sola vez al encolarse, como una línea JSON
+    comprimida en `journal_YYYY-MM-DD.ndjson.gz` (un archivo por día). Cada
+    append es un miembro gzip completo, así que un apagón a media escritura
+    sólo puede perder la última línea. La retención es por tamaño total.
+    """
+
+    def __init__(self, backup_dir: str, max_bytes: int = 50 * 1024 * 1024):
+        self.backup_dir = backup_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(backup_dir, exist_ok=True)
+
+    def path_for(self, day: date) -> str:
+        return os.path.join(self.backup_dir, f"{_PREFIX}{day.isoformat()}{_SUFFIX}")
+
+    def append(self, op: str, payload: dict, created_at: str) -> None:
+        line = json.dumps({"op": op, "payload": payload, "created_at": created_at}, ensure_ascii=False)
+        data = gzip.compress((line + "\n").encode("utf-8"))
+        with self._lock:
+            with open(self.path_for(date.today()), "ab") as f:
+                f.write(data)
+
+    def files(self, desde: date | None = None, hasta: date | None = None) -> list[str]:
+        result = []
+        for path in sorted(glob.glob(os.path.join(self.backup_dir, f"{_PREFIX}*{_SUFFIX}"))):
+            day = self._day_of(path)
+            if day is None:
+                continue
+            if desde and day < desde:
+                continue
+            if hasta and day > hasta:
+                continue
+            result.append(path)
+        return result
+
+    def iter_records(self, desde: date | None = None, hasta: date | None = None) -> Iterator[dict]:
+        # Lee archivo por archivo y línea por línea: memoria constante
+        for path in self.files(desde, hasta):
+            yield from self.read_file(path)
+
+    def prune(self) -> list[str]:
+        # Borra los días más viejos hasta quedar bajo max_bytes; nunca el de hoy
+        removed = []
+        with self._lock:
+            paths = self.files()
+            sizes = {p: os.path.getsize(p) for p in paths}
+            total = sum(sizes.values())
+            today = self.path_for(date.today())
+            for path in paths:
+                if total <= self.max_bytes or path == today:
+                    break
+                os.remove(path)
+                total -= sizes[path]
+                removed.append(path)
+        return removed
+
+    def read_file(self, path: str) -> Iterator[dict]:
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+        except (EOFError, zlib.error, gzip.BadGzipFile):
+            # Último miembro truncado (apagón): lo anterior ya se entregó
+            return
+
+    def _day_of(self, path: str) -> date | None:
+        name = os.path.basename(path)[len(_PREFIX):-len(_SUFFIX)]
+        try:
+            return datetime.strptime(name, "%Y-%m-%d").date()
+        except ValueError:
+            return None
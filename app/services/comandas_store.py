@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+
+from .ids import uuid7
+
+_HEADER_COLS = ("folio_local", "created_at", "mesero", "mesa", "metodo", "propina", "recibido")
+_LINE_COLS = ("producto_id", "nombre_snapshot", "precio_unitario", "cantidad", "subtotal")
+
+_UPSERT_COMANDA = (
+    "INSERT INTO comandas_abiertas (uid, orden, folio_local, created_at, mesero, mesa, metodo, propina, recibido) "
+    "VALUES (?, COALESCE((SELECT orden FROM comandas_abiertas WHERE uid = ?), "
+    "(SELECT COALESCE(MAX(orden), 0) + 1 FROM comandas_abiertas)), ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(uid) DO UPDATE SET folio_local = excluded.folio_local, created_at = excluded.created_at, "
+    "mesero = excluded.mesero, mesa = excluded.mesa, metodo = excluded.metodo, "
+    "propina = excluded.propina, recibido = excluded.recibido"
+)
+_UPSERT_LINEA = (
+    "INSERT INTO comanda_lineas (comanda_uid, pos, producto_id, nombre_snapshot, precio_unitario, cantidad, subtotal) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(comanda_uid, pos) DO UPDATE SET producto_id = excluded.producto_id, "
+    "nombre_snapshot = excluded.nombre_snapshot, precio_unitario = excluded.precio_unitario, "
+    "cantidad = excluded.cantidad, subtotal = excluded.subtotal"
+)
+_TRIM_LINEAS = "DELETE FROM comanda_lineas WHERE comanda_uid = ? AND pos >= ?"
+_DELETE_LINEAS = "DELETE FROM comanda_lineas WHERE comanda_uid = ?"
+_DELETE_COMANDA = "DELETE FROM comandas_abiertas WHERE uid = ?"
+_SET_ACTIVA = "INSERT OR REPLACE INTO comandas_meta (key, value) VALUES ('activa', ?)"
+_SELECT_COMANDAS = (
+    "SELECT uid, folio_local, created_at, mesero, mesa, metodo, propina, recibido "
+    "FROM comandas_abiertas ORDER BY orden"
+)
+_SELECT_LINEAS = (
+    "SELECT comanda_uid, producto_id, nombre_snapshot, precio_unitario, cantidad, subtotal "
+    "FROM comanda_lineas ORDER BY comanda_uid, pos"
+)
+_SELECT_ACTIVA = "SELECT value FROM comandas_meta WHERE key = 'activa'"
+
+
+class ComandasStore:
+    """Comandas abiertas (aún sin cobrar) en SQLite: `app/data/comandas.db`.
+
+    Cada comanda se identifica por `uid` y sus líneas por (uid, posición).
+    `put`/`delete`/`set_activa` sólo anotan el cambio en memoria; `flush`
+    escribe lo pendiente en una sola transacción, tocando únicamente las
+    comandas y las líneas que cambiaron. Un apagón deja la base en el último
+    flush completo.
+    """
+
+    def __init__(self, base_dir: str, synchronous: str = "FULL"):
+        data_dir = os.path.join(base_dir, "data")
+        os.makedirs(data_dir, exist_ok=True)
+        self.db_path = os.path.join(data_dir, "comandas.db")
+        # Los flush ya van agrupados, así que se paga el fsync de cada uno:
+        # una comanda abierta no tiene otra copia.
+        self.synchronous = synchronous
+        self._local = threading.local()
+        # uid -> comanda pendiente (None = borrar); se escribe en flush()
+        self._pending: dict[str, dict | None] = {}
+        self._pending_activa: tuple[str | None] | None = None
+        # uid -> (encabezado, líneas) tal como quedaron en la base
+        self._saved: dict[str, tuple[tuple, list[tuple]]] = {}
+        self._saved_activa: str | None = None
+        self._init_db()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, cached_statements=32)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _init_db(self) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS comandas_abiertas (
+                    uid TEXT PRIMARY KEY,
+                    orden INTEGER NOT NULL,
+                    folio_local TEXT,
+                    created_at TEXT,
+                    mesero TEXT,
+                    mesa TEXT,
+                    metodo TEXT,
+                    propina TEXT,
+                    recibido TEXT
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS comanda_lineas (
+                    comanda_uid TEXT NOT NULL,
+                    pos INTEGER NOT NULL,
+                    producto_id INTEGER,
+                    nombre_snapshot TEXT,
+                    precio_unitario REAL,
+                    cantidad INTEGER,
+                    subtotal REAL,
+                    PRIMARY KEY (comanda_uid, pos)
+                ) WITHOUT ROWID
+                """
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS comandas_meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def load(self) -> tuple[list[dict], str | None]:
+        """Regresa (comandas en orden de apertura, uid de la activa)."""
+        conn = self._conn()
+        # Una sola transacción de lectura: encabezados y líneas del mismo flush
+        with conn:
+            conn.execute("BEGIN")
+            heads = conn.execute(_SELECT_COMANDAS).fetchall()
+            lineas = conn.execute(_SELECT_LINEAS).fetchall()
+            row = conn.execute(_SELECT_ACTIVA).fetchone()
+
+        por_uid: dict[str, list[tuple]] = {}
+        for r in lineas:
+            por_uid.setdefault(r[0], []).append(tuple(r[1:]))
+
+        comandas = []
+        self._saved = {}
+        for r in heads:
+            uid = r[0]
+            rows = por_uid.get(uid, [])
+            c = dict(zip(_HEADER_COLS, r[1:]), uid=uid)
+            c["items"] = [dict(zip(_LINE_COLS, line)) for line in rows]
+            comandas.append(c)
+            self._saved[uid] = (tuple(r[1:]), rows)
+        self._saved_activa = row[0] if row else None
+        return comandas, self._saved_activa
+
+    def put(self, comanda: dict) -> None:
+        # La comanda debe traer "uid"; se copia para que cambios posteriores
+        # del llamador no alteren lo pendiente.
+        self._pending[comanda["uid"]] = dict(comanda, items=[it.copy() for it in comanda.get("items", [])])
+
+    def delete(self, uid: str) -> None:
+        self._pending[uid] = None
+
+    def set_activa(self, uid: str | None) -> None:
+        if uid == self._saved_activa:
+            self._pending_activa = None
+            return
+        self._pending_activa = (uid,)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._pending) or self._pending_activa is not None
+
+    def flush(self) -> None:
+        if not self.dirty:
+            return
+        pending, self._pending = self._pending, {}
+        activa, self._pending_activa = self._pending_activa, None
+        conn = self._conn()
+        saved = dict(self._saved)
+        try:
+            with conn:
+                for uid, comanda in pending.items():
+                    if comanda is None:
+                        conn.execute(_DELETE_LINEAS, (uid,))
+                        conn.execute(_DELETE_COMANDA, (uid,))
+                        saved.pop(uid, None)
+                        continue
+                    saved[uid] = self._write(conn, uid, comanda, saved.get(uid))
+                if activa is not None:
+                    conn.execute(_SET_ACTIVA, activa)
+        except sqlite3.Error:
+            # Se reintenta en el siguiente flush; lo más nuevo gana
+            for uid, comanda in pending.items():
+                self._pending.setdefault(uid, comanda)
+            if self._pending_activa is None:
+                self._pending_activa = activa
+            raise
+        self._saved = saved
+        if activa is not None:
+            self._saved_activa = activa[0]
+
+    def _write(self, conn: sqlite3.Connection, uid: str, comanda: dict, prev: tuple | None) -> tuple:
+        head = tuple(comanda.get(k) for k in _HEADER_COLS)
+        lines = [tuple(it.get(k) for k in _LINE_COLS) for it in comanda.get("items", [])]
+        prev_head, prev_lines = prev if prev is not None else (None, [])
+        if head != prev_head:
+            conn.execute(_UPSERT_COMANDA, (uid, uid) + head)
+        for pos, line in enumerate(lines):
+            if pos >= len(prev_lines) or prev_lines[pos] != line:
+                conn.execute(_UPSERT_LINEA, (uid, pos) + line)
+        if len(prev_lines) > len(lines):
+            conn.execute(_TRIM_LINEAS, (uid, len(lines)))
+        return head, lines
+
+    def migrate_json(self, path: str) -> bool:
+        """Importa un `comandas_abiertas.json` previo si la base está vacía.
+
+        El JSON se renombra a `.migrated` para no importarlo dos veces.
+        Regresa True si importó algo.
+        """
+        if not os.path.exists(path):
+            return False
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM comandas_abiertas LIMIT 1").fetchone():
+            return False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        comandas = data.get("comandas") or []
+        active = data.get("active_index")
+        for i, c in enumerate(comandas):
+            c.setdefault("uid", uuid7())
+            self.put(c)
+            if i == active:
+                self.set_activa(c["uid"])
+        self.flush()
+        os.replace(path, path + ".migrated")
+        return bool(comandas)
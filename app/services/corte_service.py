@@ -1,62 +1,114 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import date
 
-from domain.corte import calc_ventas_por_metodo
+from domain.corte import calc_ventas_por_metodo, resumen_por_metodo
+from domain.money import to_cents, to_pesos
+from .replica import use_local
+from .report_cache import cached_report
+from .settings import SUPABASE_CONNECT_TIMEOUT, SUPABASE_TIMEOUT
+from .registry import get_service
 from .supabase_service import SupabaseService
 
-
 def _get_db(db: SupabaseService | None) -> SupabaseService:
-    return db or SupabaseService()
+    # Sin db explícito se usa el servicio compartido del proceso
+    return db or get_service()
 
 
-def get_ventas_por_metodo(fecha: date, db: SupabaseService | None = None) -> dict:
+@cached_report("corte.ventas_por_metodo")
+def get_ventas_por_metodo(fecha: date, db: SupabaseService | None = None, backend: str | None = None) -> dict:
     db = _get_db(db)
+    if use_local(backend):
+        resumen = resumen_por_metodo(db.replica.ventas_por_metodo(fecha, fecha))
+        return {k: to_pesos(v) for k, v in resumen.items()}
     desde, hasta = db._day_range(fecha)
-    rows = (
-        db.client.table("comandas")
+    rows = db.iter_rows(
+        lambda: db.client.table("comandas")
         .select("total, metodo_pago")
         .gte("created_at", desde)
         .lte("created_at", hasta)
-        .execute()
-    ).data or []
+        .order("created_at")
+        .order("id")
+    )
     return calc_ventas_por_metodo(rows)
 
 
-def get_gastos_total(fecha: date, db: SupabaseService | None = None) -> float:
+@cached_report("corte.gastos_total")
+def get_gastos_total(fecha: date, db: SupabaseService | None = None, backend: str | None = None) -> float:
     db = _get_db(db)
+    if use_local(backend):
+        return to_pesos(db.replica.gastos_total(fecha, fecha))
     desde, hasta = db._day_range(fecha)
-    rows = (
-        db.client.table("gastos")
+    rows = db.iter_rows(
+        lambda: db.client.table("gastos")
         .select("monto")
         .gte("created_at", desde)
         .lte("created_at", hasta)
-        .execute()
-    ).data or []
-    return round(sum(float(r.get("monto") or 0) for r in rows), 2)
+        .order("created_at")
+        .order("id")
+    )
+    return to_pesos(sum(to_cents(r.get("monto")) for r in rows))
 
 
-def get_propinas_total(fecha: date, db: SupabaseService | None = None) -> float:
+@cached_report("corte.propinas_total")
+def get_propinas_total(fecha: date, db: SupabaseService | None = None, backend: str | None = None) -> float:
     db = _get_db(db)
+    if use_local(backend):
+        return to_pesos(db.replica.propinas_total(fecha, fecha))
     desde, hasta = db._day_range(fecha)
-    rows = (
-        db.client.table("propinas")
+    rows = db.iter_rows(
+        lambda: db.client.table("propinas")
         .select("monto")
         .gte("fecha", desde)
         .lte("fecha", hasta)
-        .execute()
-    ).data or []
-    return round(sum(float(r.get("monto") or 0) for r in rows), 2)
+        .order("fecha")
+        .order("id")
+    )
+    return to_pesos(sum(to_cents(r.get("monto")) for r in rows))
 
 
-def get_corte_por_fecha(fecha: date, db: SupabaseService | None = None) -> dict | None:
+def get_corte_por_fecha(fecha: date, db: SupabaseService | None = None, backend: str | None = None) -> dict | None:
     db = _get_db(db)
-    res = db.client.table("cierres_caja").select("*").eq("fecha", fecha.isoformat()).execute()
+    if use_local(backend):
+        return db.replica.cierre(fecha)
+    res = db.execute(db.client.table("cierres_caja").select("*").eq("fecha", fecha.isoformat()))
     if not res.data:
         return None
     return res.data[0]
 
 
+def get_corte_inputs(
+    fecha: date,
+    db: SupabaseService | None = None,
+    backend: str | None = None,
+    timeout: float | None = None,
+) -> dict:
+    # Las cuatro lecturas del corte en paralelo con el mismo cliente: la
+    # espera es la de la más lenta y no la suma. Si en `timeout` segundos no
+    # terminan todas se lanza TimeoutError; el primer error de una lectura
+    # se propaga tal cual. Una lectura ya en curso no se puede cancelar:
+    # sigue hasta su propio timeout HTTP. Por eso cada llamada usa sus
+    # propios hilos y las lecturas colgadas no frenan el siguiente corte.
+    db = _get_db(db)
+    timeout = timeout if timeout is not None else SUPABASE_TIMEOUT + SUPABASE_CONNECT_TIMEOUT
+    executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="corte")
+    try:
+        futures = {
+            "ventas": executor.submit(get_ventas_por_metodo, fecha, db=db, backend=backend),
+            "gastos_total": executor.submit(get_gastos_total, fecha, db=db, backend=backend),
+            "propinas_total": executor.submit(get_propinas_total, fecha, db=db, backend=backend),
+            "corte": executor.submit(get_corte_por_fecha, fecha, db=db, backend=backend),
+        }
+        _, pendientes = wait(futures.values(), timeout=timeout)
+        if pendientes:
+            raise TimeoutError(f"El corte no cargó en {timeout:g} s")
+        return {name: f.result() for name, f in futures.items()}
+    finally:
+        # Sin esperar: los hilos de lecturas colgadas terminan solos
+        executor.shutdown(wait=False)
+
+
 def save_corte(payload: dict, db: SupabaseService | None = None) -> dict:
     db = _get_db(db)
     fecha = payload.get("fecha")
@@ -73,10 +125,11 @@ def save_corte(payload: dict, db: SupabaseService | None = None) -> dict:
         "notas": payload.get("notas"),
     }
 
-    existente = get_corte_por_fecha(date.fromisoformat(fecha), db=db)
+    # Siempre contra Supabase: la réplica puede no tener aún el cierre
+    existente = get_corte_por_fecha(date.fromisoformat(fecha), db=db, backend="supabase")
     if existente:
-        res = db.client.table("cierres_caja").update(data).eq("id", existente["id"]).execute()
+        res = db.execute(db.client.table("cierres_caja").update(data).eq("id", existente["id"]))
         return res.data[0]
 
-    res = db.client.table("cierres_caja").insert(data).execute()
+    res = db.execute(db.client.table("cierres_caja").insert(data))
     return res.data[0]
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import csv
+import functools
+import gzip
+import os
+from datetime import date
+from typing import Callable, Iterable, Iterator
+
+from .replica import use_local
+from .registry import get_service
+from .supabase_service import SupabaseService
+
+# Filas que se acumulan antes de cada writerows (y de cada aviso de avance)
+CHUNK_ROWS = 500
+
+COMANDAS_COLS = [
+    "comanda_id", "folio", "created_at", "mesero", "metodo_pago", "total", "recibido", "cambio", "status",
+    "item_uid", "producto_id", "producto", "precio_unitario", "cantidad", "subtotal",
+]
+GASTOS_COLS = ["id", "created_at", "concepto", "categoria", "monto", "metodo_pago", "nota"]
+PROPINAS_COLS = ["id", "fecha", "mesero_id", "mesero", "monto", "fuente", "comanda_id"]
+
+_ITEM_KEYS = ("uid", "producto_id", "nombre_snapshot", "precio_unitario", "cantidad", "subtotal")
+
+
+def _get_db(db: SupabaseService | None) -> SupabaseService:
+    # Sin db explícito se usa el servicio compartido del proceso
+    return db or get_service()
+
+
+def exportar_detalle(
+    fecha_inicio: date,
+    fecha_fin: date,
+    dest_dir: str,
+    db: SupabaseService | None = None,
+    backend: str | None = None,
+    comprimir: bool = False,
+    progress: Callable[[str, int], None] | None = None,
+) -> list[str]:
+    """Exporta a CSV cada comanda con sus items, los gastos y las propinas.
+
+    Escribe tres archivos en `dest_dir` (con `.gz` si `comprimir`). Las filas
+    se leen por páginas y se escriben por bloques de CHUNK_ROWS, así que la
+    memoria no depende del tamaño del rango. `progress(tabla, filas)` se
+    llama después de cada bloque. Regresa las rutas escritas.
+    """
+    if fecha_fin < fecha_inicio:
+        raise ValueError("fecha_fin debe ser >= fecha_inicio")
+    db = _get_db(db)
+    local = use_local(backend)
+    os.makedirs(dest_dir, exist_ok=True)
+
+    fuentes = (
+        ("comandas", COMANDAS_COLS, _comandas_local if local else _comandas_supabase),
+        ("gastos", GASTOS_COLS, _gastos_local if local else _gastos_supabase),
+        ("propinas", PROPINAS_COLS, _propinas_local if local else _propinas_supabase),
+    )
+    paths = []
+    for tabla, cols, fuente in fuentes:
+        name = f"detalle_{tabla}_{fecha_inicio.isoformat()}_{fecha_fin.isoformat()}.csv"
+        path = os.path.join(dest_dir, name + (".gz" if comprimir else ""))
+        on_chunk = functools.partial(progress, tabla) if progress else None
+        _write_csv(path, cols, fuente(db, fecha_inicio, fecha_fin), comprimir, on_chunk)
+        paths.append(path)
+    return paths
+
+
+def _write_csv(
+    path: str,
+    cols: list[str],
+    rows: Iterable[list],
+    comprimir: bool,
+    on_chunk: Callable[[int], None] | None,
+) -> None:
+    # Se escribe a .part y se renombra al final: un archivo con el nombre
+    # final siempre está completo.
+    tmp = path + ".part"
+    opener = gzip.open if comprimir else open
+    try:
+        with opener(tmp, "wt", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(cols)
+            chunk = []
+            total = 0
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= CHUNK_ROWS:
+                    w.writerows(chunk)
+                    total += len(chunk)
+                    chunk = []
+                    if on_chunk:
+                        on_chunk(total)
+            w.writerows(chunk)
+            if on_chunk and (chunk or not total):
+                on_chunk(total + len(chunk))
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+# ---------------- Supabase ----------------
+def _comandas_supabase(db: SupabaseService, fecha_inicio: date, fecha_fin: date) -> Iterator[list]:
+    desde, _ = db._day_range(fecha_inicio)
+    _, hasta = db._day_range(fecha_fin)
+    rows = db.iter_rows(
+        lambda: db.client.table("comandas")
+        .select(
+            "id, folio, created_at, mesero, metodo_pago, total, recibido, cambio, status, "
+            "comanda_items(uid, producto_id, nombre_snapshot, precio_unitario, cantidad, subtotal)"
+        )
+        .gte("created_at", desde)
+        .lte("created_at", hasta)
+        .order("created_at")
+        .order("id")
+    )
+    for r in rows:
+        head = [r.get("id"), r.get("folio"), r.get("created_at"), r.get("mesero"), r.get("metodo_pago"),
+                r.get("total"), r.get("recibido"), r.get("cambio"), r.get("status")]
+        items = r.get("comanda_items") or []
+        if not items:
+            yield head + [None] * len(_ITEM_KEYS)
+        for it in items:
+            yield head + [it.get(k) for k in _ITEM_KEYS]
+
+
+def _gastos_supabase(db: SupabaseService, fecha_inicio: date, fecha_fin: date) -> Iterator[list]:
+    desde, _ = db._day_range(fecha_inicio)
+    _, hasta = db._day_range(fecha_fin)
+    rows = db.iter_rows(
+        lambda: db.client.table("gastos")
+        .select("id, created_at, concepto, categoria, monto, metodo_pago, nota")
+        .gte("created_at", desde)
+        .lte("created_at", hasta)
+        .order("created_at")
+        .order("id")
+    )
+    for r in rows:
+        yield [r.get(c) for c in GASTOS_COLS]
+
+
+def _propinas_supabase(db: SupabaseService, fecha_inicio: date, fecha_fin: date) -> Iterator[list]:
+    desde, _ = db._day_range(fecha_inicio)
+    _, hasta = db._day_range(fecha_fin)
+    rows = db.iter_rows(
+        lambda: db.client.table("propinas")
+        .select("id, fecha, mesero_id, mesero_nombre_snapshot, monto, fuente, comanda_id")
+        .gte("fecha", desde)
+        .lte("fecha", hasta)
+        .order("fecha")
+        .order("id")
+    )
+    for r in rows:
+        yield [r.get("id"), r.get("fecha"), r.get("mesero_id"), r.get("mesero_nombre_snapshot"),
+               r.get("monto"), r.get("fuente"), r.get("comanda_id")]
+
+
+# ---------------- Réplica local ----------------
+# La réplica guarda los importes en centavos; el CSV los lleva en pesos
+# como el export desde Supabase.
+def _cursor_rows(db: SupabaseService, sql: str, fecha_inicio: date, fecha_fin: date) -> Iterator[list]:
+    for row in db.replica.iter_query(sql, (fecha_inicio.isoformat(), fecha_fin.isoformat()), CHUNK_ROWS):
+        yield list(row)
+
+
+def _comandas_local(db: SupabaseService, fecha_inicio: date, fecha_fin: date) -> Iterator[list]:
+    return _cursor_rows(
+        db,
+        "SELECT c.id, c.folio, c.created_at, c.mesero, c.metodo_pago, c.total / 100.0, c.recibido / 100.0, "
+        "c.cambio / 100.0, c.status, i.uid, i.producto_id, i.nombre_snapshot, i.precio_unitario / 100.0, "
+        "i.cantidad, i.subtotal / 100.0 "
+        "FROM comandas c LEFT JOIN comanda_items i ON i.comanda_id = c.id "
+        "WHERE c.dia BETWEEN ? AND ? ORDER BY c.created_at, c.id",
+        fecha_inicio,
+        fecha_fin,
+    )
+
+
+def _gastos_local(db: SupabaseService, fecha_inicio: date, fecha_fin: date) -> Iterator[list]:
+    return _cursor_rows(
+        db,
+        "SELECT id, created_at, concepto, categoria, monto / 100.0, metodo_pago, nota "
+        "FROM gastos WHERE dia BETWEEN ? AND ? ORDER BY created_at, id",
+        fecha_inicio,
+        fecha_fin,
+    )
+
+
+def _propinas_local(db: SupabaseService, fecha_inicio: date, fecha_fin: date) -> Iterator[list]:
+    return _cursor_rows(
+        db,
+        "SELECT id, fecha, mesero_id, mesero_nombre_snapshot, monto / 100.0, fuente, comanda_id "
+        "FROM propinas WHERE dia BETWEEN ? AND ? ORDER BY fecha, id",
+        fecha_inicio,
+        fecha_fin,
+    )
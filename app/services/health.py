@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import json
+import re
+import threading
+import time
+from typing import Callable
+
+import httpx
+
+
+# PostgREST responde 503 con estos códigos cuando no llega a la base (sin
+# conexión, pool agotado, caché de esquema sin cargar): APIError.code trae el
+# texto, no el status HTTP.
+_PGRST_CONEXION = frozenset({"PGRST000", "PGRST001", "PGRST002"})
+# Errores de la petición misma (PGRST100-PGRST199)
+_PGRST_PETICION = re.compile(r"PGRST1\d\d")
+
+
+class BackendUnavailableError(ConnectionError):
+    """El circuito está abierto: la llamada no se intentó."""
+
+
+def is_connection_error(exc: Exception) -> bool:
+    # Fallas de enlace (DNS, conexión, timeout) o respuestas 5xx del gateway.
+    # Un APIError con código de Postgres significa que el backend sí respondió,
+    # salvo los PGRST00x: PostgREST respondió pero la base no.
+    if isinstance(exc, (httpx.TransportError, json.JSONDecodeError, BackendUnavailableError)):
+        return True
+    code = getattr(exc, "code", None)
+    if isinstance(code, str):
+        return code in _PGRST_CONEXION
+    return isinstance(code, int) and code >= 500
+
+
+def is_permanent_error(exc: Exception) -> bool:
+    # Errores que ningún reintento va a arreglar: el payload viola un CHECK o
+    # una llave (clase 23), trae datos inválidos (clase 22), PostgREST no
+    # pudo leer la petición (PGRST1xx) o el payload local está mal formado.
+    # Esquema faltante (42xxx, PGRST2xx) o credenciales (PGRST3xx) se tratan
+    # como transitorios: se arreglan desplegando, no descartando la op.
+    if is_connection_error(exc):
+        return False
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return 400 <= code < 500
+    if isinstance(code, str) and code:
+        if code.startswith("PGRST"):
+            return _PGRST_PETICION.fullmatch(code) is not None
+        return code[:2] in ("22", "23")
+    return isinstance(exc, (KeyError, TypeError, ValueError))
+
+
+class CircuitBreaker:
+    """Circuit breaker sencillo para las llamadas a Supabase.
+
+    Cerrado: todo pasa. Tras `failure_threshold` fallas de conexión seguidas se
+    abre y rechaza de inmediato durante `cooldown` segundos; después, la
+    siguiente llamada corre `probe` (una petición barata con timeout corto) y
+    el circuito se cierra sólo si ésta responde.
+    """
+
+    def __init__(self, probe: Callable[[], bool], failure_threshold: int = 2, cooldown: float = 15.0):
+        self._probe = probe
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+        # Se llama cuando el circuito pasa de abierto a cerrado
+        self.on_close: Callable[[], None] | None = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.cooldown:
+                return False
+            self._probing = True
+
+        try:
+            ok = self._probe()
+        except Exception:
+            ok = False
+
+        with self._lock:
+            self._probing = False
+            if not ok:
+                self._opened_at = time.monotonic()
+        if ok:
+            self.record_success()
+        return ok
+
+    def record_success(self) -> None:
+        with self._lock:
+            was_open = self._opened_at is not None
+            self._failures = 0
+            self._opened_at = None
+        if was_open and self.on_close is not None:
+            self.on_close()
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+import os
+import time
+import uuid
+
+
+def uuid7() -> str:
+    """UUID versión 7 (RFC 9562): 48 bits de timestamp en ms + 74 aleatorios.
+
+    Ordena por tiempo de creación, así que sirve como llave primaria generada
+    en la caja sin fragmentar los índices de Postgres.
+    """
+    ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big")
+    value = (ms & ((1 << 48) - 1)) << 80
+    value |= 0x7 << 76
+    value |= ((rand >> 68) & 0xFFF) << 64
+    value |= 0b10 << 62
+    value |= rand & ((1 << 62) - 1)
+    return str(uuid.UUID(int=value))
@@ -3,20 +3,66 @@ from __future__ import annotations
 import json
 import os
 import sqlite3
-from datetime import datetime
+import threading
+from datetime import date, datetime
+from typing import Callable, Iterable, Iterator
+
+from .backup_journal import BackupJournal
+
+# Sentencias fijas: sqlite3 reutiliza el statement preparado cuando el texto
+# es idéntico, así que se definen una sola vez.
+_INSERT_OP = "INSERT INTO offline_ops (op, payload, created_at) VALUES (?, ?, ?)"
+_SELECT_OPS = "SELECT id, op, payload, created_at FROM offline_ops ORDER BY id"
+_SELECT_OPS_LIMIT = _SELECT_OPS + " LIMIT ?"
+_SELECT_PAGE = "SELECT id, op, payload, created_at FROM offline_ops WHERE id > ? ORDER BY id LIMIT ?"
+_COUNT_OPS = "SELECT COUNT(*) FROM offline_ops"
+_OLDEST_OP = "SELECT created_at FROM offline_ops ORDER BY id LIMIT 1"
+_OPS_BEFORE = "SELECT 1 FROM offline_ops WHERE created_at < ? LIMIT 1"
+_DELETE_OP = "DELETE FROM offline_ops WHERE id = ?"
+_UPDATE_PAYLOAD = "UPDATE offline_ops SET payload = ? WHERE id = ?"
+_SELECT_PAYLOAD_IDS = "SELECT json_extract(payload, '$.id') FROM offline_ops"
+_INSERT_DEAD = (
+    "INSERT OR REPLACE INTO dead_letter_ops (id, op, payload, created_at, failed_at, error) "
+    "SELECT id, op, payload, created_at, ?, ? FROM offline_ops WHERE id = ?"
+)
+_SELECT_DEAD = "SELECT id, op, payload, created_at, failed_at, error FROM dead_letter_ops ORDER BY id"
+_COUNT_DEAD = "SELECT COUNT(*) FROM dead_letter_ops"
 
 
 class OfflineStore:
-    def __init__(self, base_dir: str):
+    def __init__(self, base_dir: str, synchronous: str = "NORMAL"):
         data_dir = os.path.join(base_dir, "data")
         os.makedirs(data_dir, exist_ok=True)
         self.db_path = os.path.join(data_dir, "offline.db")
+        self.journal = BackupJournal(os.path.join(data_dir, "backups"))
+        # Se llama después de cada enqueue (p. ej. para despertar al sync)
+        self.on_enqueue: Callable[[], None] | None = None
+        # En WAL, NORMAL sólo hace fsync en checkpoints: sobrevive a que la app
+        # truene y en un apagón pierde a lo más las últimas transacciones.
+        self.synchronous = synchronous
+        self._local = threading.local()
         self._init_db()
 
+    def _conn(self) -> sqlite3.Connection:
+        # Una conexión larga por hilo (la UI y el hilo de sync no la comparten)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, cached_statements=32)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
     def _init_db(self) -> None:
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            cur.execute(
+        conn = self._conn()
+        with conn:
+            conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS offline_ops (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -26,21 +72,40 @@ class OfflineStore:
                 )
                 """
             )
-            conn.commit()
-
-    def enqueue(self, op: str, payload: dict) -> None:
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO offline_ops (op, payload, created_at) VALUES (?, ?, ?)",
-                (op, json.dumps(payload, ensure_ascii=False), datetime.now().isoformat(timespec="seconds")),
+            # Ops que el backend rechazó de forma definitiva; se guardan con el
+            # error para revisarlas a mano en vez de reintentarlas siempre.
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS dead_letter_ops (
+                    id INTEGER PRIMARY KEY,
+                    op TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    failed_at TEXT NOT NULL,
+                    error TEXT NOT NULL
+                )
+                """
             )
-            conn.commit()
 
-    def list_ops(self) -> list[dict]:
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            rows = cur.execute("SELECT id, op, payload, created_at FROM offline_ops ORDER BY id").fetchall()
+    def enqueue(self, op: str, payload: dict, backup: bool = True) -> None:
+        created_at = datetime.now().isoformat(timespec="seconds")
+        conn = self._conn()
+        with conn:
+            conn.execute(_INSERT_OP, (op, json.dumps(payload, ensure_ascii=False), created_at))
+        if backup:
+            try:
+                self.journal.append(op, payload, created_at)
+            except OSError:
+                # Sin respaldo no se pierde la venta: la cola ya tiene la op
+                pass
+        if self.on_enqueue is not None:
+            self.on_enqueue()
+
+    def list_ops(self, limit: int | None = None) -> list[dict]:
+        if limit is not None and limit > 0:
+            rows = self._conn().execute(_SELECT_OPS_LIMIT, (limit,)).fetchall()
+        else:
+            rows = self._conn().execute(_SELECT_OPS).fetchall()
         result = []
         for row in rows:
             result.append({
@@ -51,19 +116,85 @@ class OfflineStore:
             })
         return result
 
+    def iter_batches(self, batch_size: int = 100, op_types: Iterable[str] | None = None) -> Iterator[list[dict]]:
+        # Paginación por llave (id > último visto): cada página es una consulta
+        # corta, así que se puede borrar entre páginas y la memoria no crece
+        # con la profundidad de la cola.
+        types = tuple(op_types) if op_types else ()
+        sql = _SELECT_PAGE
+        if types:
+            marks = ", ".join("?" for _ in types)
+            sql = f"SELECT id, op, payload, created_at FROM offline_ops WHERE id > ? AND op IN ({marks}) ORDER BY id LIMIT ?"
+        last_id = 0
+        while True:
+            rows = self._conn().execute(sql, (last_id, *types, batch_size)).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [
+                {"id": row[0], "op": row[1], "payload": json.loads(row[2]), "created_at": row[3]}
+                for row in rows
+            ]
+
+    def iter_ops(self, batch_size: int = 100, op_types: Iterable[str] | None = None) -> Iterator[dict]:
+        for batch in self.iter_batches(batch_size, op_types):
+            yield from batch
+
+    def count_ops(self) -> int:
+        return int(self._conn().execute(_COUNT_OPS).fetchone()[0])
+
+    def oldest_created_at(self) -> datetime | None:
+        row = self._conn().execute(_OLDEST_OP).fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def has_ops_before(self, limite: datetime) -> bool:
+        # created_at de la cola es hora local sin zona, igual que `limite`
+        return self._conn().execute(_OPS_BEFORE, (limite.isoformat(timespec="seconds"),)).fetchone() is not None
+
+    def update_payload(self, op_id: int, payload: dict) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(_UPDATE_PAYLOAD, (json.dumps(payload, ensure_ascii=False), op_id))
+
     def delete_op(self, op_id: int) -> None:
-        with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            cur.execute("DELETE FROM offline_ops WHERE id = ?", (op_id,))
-            conn.commit()
-
-    def daily_backup(self, base_dir: str) -> None:
-        backup_dir = os.path.join(base_dir, "data", "backups")
-        os.makedirs(backup_dir, exist_ok=True)
-        stamp = datetime.now().strftime("%Y-%m-%d")
-        path = os.path.join(backup_dir, f"offline_{stamp}.json")
-        if os.path.exists(path):
+        self.delete_ops([op_id])
+
+    def delete_ops(self, op_ids: list[int]) -> None:
+        # Borra un bloque completo en una sola transacción
+        if not op_ids:
             return
-        data = {"generated_at": datetime.now().isoformat(timespec="seconds"), "ops": self.list_ops()}
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        conn = self._conn()
+        with conn:
+            conn.executemany(_DELETE_OP, [(i,) for i in op_ids])
+
+    def move_to_dead_letter(self, op_id: int, error: str) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(_INSERT_DEAD, (datetime.now().isoformat(timespec="seconds"), error, op_id))
+            conn.execute(_DELETE_OP, (op_id,))
+
+    def list_dead_letter(self) -> list[dict]:
+        rows = self._conn().execute(_SELECT_DEAD).fetchall()
+        return [
+            {"id": r[0], "op": r[1], "payload": json.loads(r[2]), "created_at": r[3], "failed_at": r[4], "error": r[5]}
+            for r in rows
+        ]
+
+    def count_dead_letter(self) -> int:
+        return int(self._conn().execute(_COUNT_DEAD).fetchone()[0])
+
+    def prune_backups(self) -> list[str]:
+        return self.journal.prune()
+
+    def restore_backup(self, desde: date | None = None, hasta: date | None = None) -> int:
+        # Re-encola lo respaldado en el rango; lo ya pendiente se salta y lo ya
+        # sincronizado es inofensivo porque el reenvío es upsert por id.
+        pending = {row[0] for row in self._conn().execute(_SELECT_PAYLOAD_IDS) if row[0]}
+        restored = 0
+        for rec in self.journal.iter_records(desde, hasta):
+            payload = rec.get("payload") or {}
+            if payload.get("id") and payload["id"] in pending:
+                continue
+            self.enqueue(rec["op"], payload, backup=False)
+            restored += 1
+        return restored
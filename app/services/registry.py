@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from .supabase_service import SupabaseService
+
+# Un SupabaseService por proceso: un solo pool HTTP/2 con keep-alive, un
+# solo circuit breaker y las tablas SQLite se inicializan una vez.
+_lock = threading.Lock()
+_shared: SupabaseService | None = None
+
+# Instancia local a un bloque `scoped_service` (por hilo / contexto)
+_scoped: ContextVar[SupabaseService | None] = ContextVar("scoped_service", default=None)
+
+
+def get_service() -> SupabaseService:
+    scoped = _scoped.get()
+    if scoped is not None:
+        return scoped
+    global _shared
+    if _shared is None:
+        with _lock:
+            # Doble verificación: dos hilos pueden llegar aquí a la vez
+            if _shared is None:
+                _shared = SupabaseService()
+    return _shared
+
+
+def set_service(db: SupabaseService | None) -> None:
+    # Registra una instancia ya creada como la compartida; None la olvida y
+    # la siguiente llamada a get_service() crea otra.
+    global _shared
+    with _lock:
+        _shared = db
+
+
+@contextmanager
+def scoped_service(db: SupabaseService | None = None) -> Iterator[SupabaseService]:
+    # Dentro del bloque get_service() regresa `db` (o una instancia nueva y
+    # privada) en vez de la compartida, p. ej. para aislar un script.
+    db = db or SupabaseService()
+    token = _scoped.set(db)
+    try:
+        yield db
+    finally:
+        _scoped.reset(token)
@@ -0,0 +1,749 @@
+from __future__ import annotations
+
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, Iterator
+
+from domain.money import Cents, to_cents, to_pesos
+
+from .settings import REPLICA_PULL_OVERLAP, REPORTES_BACKEND
+
+# Backends válidos para reportes y corte
+BACKENDS = ("supabase", "local")
+
+# Columnas que se bajan de cada tabla. Los items viajan embebidos en su
+# comanda: registrar_comanda los inserta en la misma transacción.
+_SELECTS = {
+    "comandas": (
+        "id, folio, created_at, metodo_pago, total, notas, mesero, recibido, cambio, status, "
+        "comanda_items(uid, producto_id, nombre_snapshot, precio_unitario, cantidad, subtotal)"
+    ),
+    "gastos": "id, created_at, concepto, categoria, monto, nota, metodo_pago",
+    "propinas": "id, fecha, mesero_id, mesero_nombre_snapshot, monto, fuente, comanda_id, created_at",
+    "cierres_caja": (
+        "id, created_at, fecha, total_ventas, total_gastos, neto, efectivo_reportado, diferencia_efectivo, notas"
+    ),
+}
+
+# Sube cuando cambia el esquema: la réplica se reconstruye desde Supabase
+_SCHEMA_VERSION = 3
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS comandas (
+        id TEXT PRIMARY KEY,
+        folio INTEGER,
+        created_at TEXT NOT NULL,
+        dia TEXT NOT NULL,
+        hora INTEGER NOT NULL,
+        metodo_pago TEXT,
+        total INTEGER NOT NULL,
+        notas TEXT,
+        mesero TEXT,
+        recibido INTEGER,
+        cambio INTEGER,
+        status TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS comandas_dia_idx ON comandas (dia, metodo_pago)",
+    """
+    CREATE TABLE IF NOT EXISTS comanda_items (
+        uid TEXT PRIMARY KEY,
+        comanda_id TEXT NOT NULL,
+        dia TEXT NOT NULL,
+        producto_id INTEGER,
+        nombre_snapshot TEXT,
+        precio_unitario INTEGER,
+        cantidad INTEGER NOT NULL,
+        subtotal INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS comanda_items_dia_idx ON comanda_items (dia, nombre_snapshot)",
+    "CREATE INDEX IF NOT EXISTS comanda_items_comanda_idx ON comanda_items (comanda_id)",
+    """
+    CREATE TABLE IF NOT EXISTS gastos (
+        id TEXT PRIMARY KEY,
+        created_at TEXT NOT NULL,
+        dia TEXT NOT NULL,
+        concepto TEXT,
+        categoria TEXT,
+        monto INTEGER NOT NULL,
+        nota TEXT,
+        metodo_pago TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS gastos_dia_idx ON gastos (dia)",
+    """
+    CREATE TABLE IF NOT EXISTS propinas (
+        id TEXT PRIMARY KEY,
+        fecha TEXT NOT NULL,
+        dia TEXT NOT NULL,
+        mesero_id TEXT,
+        mesero_nombre_snapshot TEXT,
+        monto INTEGER NOT NULL,
+        fuente TEXT,
+        comanda_id TEXT,
+        created_at TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS propinas_dia_idx ON propinas (dia)",
+    """
+    CREATE TABLE IF NOT EXISTS cierres_caja (
+        id TEXT PRIMARY KEY,
+        created_at TEXT NOT NULL,
+        fecha TEXT NOT NULL,
+        total_ventas REAL,
+        total_gastos REAL,
+        neto REAL,
+        efectivo_reportado REAL,
+        diferencia_efectivo REAL,
+        notas TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS cierres_caja_fecha_idx ON cierres_caja (fecha)",
+    # Rollups por día: los mantienen los triggers de abajo en la misma
+    # transacción que las filas, así que nunca se desfasan de la réplica.
+    # Los importes (aquí y en comandas/items/gastos/propinas) van en
+    # centavos enteros: las sumas y restas de los triggers son exactas.
+    """
+    CREATE TABLE IF NOT EXISTS rollup_ventas (
+        dia TEXT NOT NULL,
+        metodo_pago TEXT NOT NULL,
+        mesero TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        num_comandas INTEGER NOT NULL,
+        PRIMARY KEY (dia, metodo_pago, mesero)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_productos (
+        dia TEXT NOT NULL,
+        producto TEXT NOT NULL,
+        cantidad INTEGER NOT NULL,
+        subtotal INTEGER NOT NULL,
+        num_lineas INTEGER NOT NULL,
+        PRIMARY KEY (dia, producto)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_gastos (
+        dia TEXT NOT NULL,
+        categoria TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        num_gastos INTEGER NOT NULL,
+        PRIMARY KEY (dia, categoria)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_propinas (
+        dia TEXT NOT NULL,
+        mesero TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        num_propinas INTEGER NOT NULL,
+        PRIMARY KEY (dia, mesero)
+    ) WITHOUT ROWID
+    """,
+    # Sumas acumuladas por métrica ("metodo:EFECTIVO", "mesero:Ana") sobre
+    # los días cerrados, hasta prefix_state.hasta. Sólo hay fila en los días
+    # en que la métrica cambió: el acumulado de un día es el de la última
+    # fila <= ese día. Un rango es cum[fin] - cum[inicio - 1].
+    """
+    CREATE TABLE IF NOT EXISTS cum_ventas (
+        metrica TEXT NOT NULL,
+        dia TEXT NOT NULL,
+        acumulado INTEGER NOT NULL,
+        PRIMARY KEY (metrica, dia)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS cum_ventas_dia_idx ON cum_ventas (dia)",
+    "CREATE TABLE IF NOT EXISTS cum_metricas (metrica TEXT PRIMARY KEY) WITHOUT ROWID",
+    """
+    CREATE TABLE IF NOT EXISTS prefix_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        hasta TEXT NOT NULL
+    )
+    """,
+    # Días cuyas filas cambiaron (pull, apply_*, discard) y que la caché de
+    # reportes aún no descarta; ver take_dias_tocados.
+    "CREATE TABLE IF NOT EXISTS dias_tocados (dia TEXT PRIMARY KEY) WITHOUT ROWID",
+    # Marca de agua por tabla: (created_at, id) de la última fila copiada, con
+    # created_at normalizado a UTC de ancho fijo (_utc) para que compare como
+    # texto; el pull la usa de filtro menos REPLICA_PULL_OVERLAP.
+    """
+    CREATE TABLE IF NOT EXISTS replica_state (
+        tabla TEXT PRIMARY KEY,
+        created_at TEXT NOT NULL,
+        id TEXT NOT NULL,
+        pulled_at TEXT NOT NULL
+    )
+    """,
+)
+
+# Aporte de cada fila a su rollup: *_ADD suma NEW y *_SUB resta OLD. Las
+# llaves usan la misma normalización que reportes_service y propinas.
+_VENTA_ADD = """
+    INSERT INTO rollup_ventas (dia, metodo_pago, mesero, total, num_comandas)
+    VALUES (NEW.dia, COALESCE(NEW.metodo_pago, ''), COALESCE(NULLIF(TRIM(NEW.mesero), ''), 'SIN MESERO'), NEW.total, 1)
+    ON CONFLICT (dia, metodo_pago, mesero)
+    DO UPDATE SET total = total + excluded.total, num_comandas = num_comandas + 1;
+"""
+_VENTA_SUB = """
+    UPDATE rollup_ventas SET total = total - OLD.total, num_comandas = num_comandas - 1
+    WHERE dia = OLD.dia AND metodo_pago = COALESCE(OLD.metodo_pago, '')
+      AND mesero = COALESCE(NULLIF(TRIM(OLD.mesero), ''), 'SIN MESERO');
+    DELETE FROM rollup_ventas WHERE dia = OLD.dia AND num_comandas <= 0;
+"""
+_PRODUCTO_ADD = """
+    INSERT INTO rollup_productos (dia, producto, cantidad, subtotal, num_lineas)
+    VALUES (NEW.dia, COALESCE(NEW.nombre_snapshot, 'SIN_NOMBRE'), NEW.cantidad, NEW.subtotal, 1)
+    ON CONFLICT (dia, producto)
+    DO UPDATE SET cantidad = cantidad + excluded.cantidad, subtotal = subtotal + excluded.subtotal, num_lineas = num_lineas + 1;
+"""
+_PRODUCTO_SUB = """
+    UPDATE rollup_productos
+    SET cantidad = cantidad - OLD.cantidad, subtotal = subtotal - OLD.subtotal, num_lineas = num_lineas - 1
+    WHERE dia = OLD.dia AND producto = COALESCE(OLD.nombre_snapshot, 'SIN_NOMBRE');
+    DELETE FROM rollup_productos WHERE dia = OLD.dia AND num_lineas <= 0;
+"""
+_GASTO_ADD = """
+    INSERT INTO rollup_gastos (dia, categoria, total, num_gastos)
+    VALUES (NEW.dia, COALESCE(NEW.categoria, 'GENERAL'), NEW.monto, 1)
+    ON CONFLICT (dia, categoria)
+    DO UPDATE SET total = total + excluded.total, num_gastos = num_gastos + 1;
+"""
+_GASTO_SUB = """
+    UPDATE rollup_gastos SET total = total - OLD.monto, num_gastos = num_gastos - 1
+    WHERE dia = OLD.dia AND categoria = COALESCE(OLD.categoria, 'GENERAL');
+    DELETE FROM rollup_gastos WHERE dia = OLD.dia AND num_gastos <= 0;
+"""
+_PROPINA_ADD = """
+    INSERT INTO rollup_propinas (dia, mesero, total, num_propinas)
+    VALUES (NEW.dia, COALESCE(NULLIF(TRIM(NEW.mesero_nombre_snapshot), ''), NEW.mesero_id, 'Sin nombre'), NEW.monto, 1)
+    ON CONFLICT (dia, mesero)
+    DO UPDATE SET total = total + excluded.total, num_propinas = num_propinas + 1;
+"""
+_PROPINA_SUB = """
+    UPDATE rollup_propinas SET total = total - OLD.monto, num_propinas = num_propinas - 1
+    WHERE dia = OLD.dia AND mesero = COALESCE(NULLIF(TRIM(OLD.mesero_nombre_snapshot), ''), OLD.mesero_id, 'Sin nombre');
+    DELETE FROM rollup_propinas WHERE dia = OLD.dia AND num_propinas <= 0;
+"""
+
+
+def _rollup_triggers(tabla: str, add: str, sub: str) -> tuple[str, ...]:
+    # Un UPDATE (p. ej. el pull reemplazando una venta aplicada localmente)
+    # resta la fila vieja y suma la nueva, aunque cambie de día o mesero.
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {tabla}_rollup_ai AFTER INSERT ON {tabla} BEGIN {add} END",
+        f"CREATE TRIGGER IF NOT EXISTS {tabla}_rollup_ad AFTER DELETE ON {tabla} BEGIN {sub} END",
+        f"CREATE TRIGGER IF NOT EXISTS {tabla}_rollup_au AFTER UPDATE ON {tabla} BEGIN {sub} {add} END",
+    )
+
+
+# Si cambia un día ya acumulado (p. ej. un cierre corregido o una venta que
+# el pull movió de día), el índice se trunca desde ahí y se vuelve a extender.
+_PREFIX_TRUNCATE = """
+    DELETE FROM cum_ventas WHERE dia >= {r}.dia;
+    UPDATE prefix_state SET hasta = date({r}.dia, '-1 day');
+"""
+
+_TRIGGERS = (
+    *(
+        f"CREATE TRIGGER IF NOT EXISTS rollup_ventas_prefix_{sufijo} AFTER {evento} ON rollup_ventas "
+        f"WHEN {r}.dia <= (SELECT hasta FROM prefix_state) BEGIN {_PREFIX_TRUNCATE.format(r=r)} END"
+        for sufijo, evento, r in (("ai", "INSERT", "NEW"), ("ad", "DELETE", "OLD"), ("au", "UPDATE", "OLD"))
+    ),
+    *_rollup_triggers("comandas", _VENTA_ADD, _VENTA_SUB),
+    *_rollup_triggers("comanda_items", _PRODUCTO_ADD, _PRODUCTO_SUB),
+    *_rollup_triggers("gastos", _GASTO_ADD, _GASTO_SUB),
+    *_rollup_triggers("propinas", _PROPINA_ADD, _PROPINA_SUB),
+    *(
+        f"CREATE TRIGGER IF NOT EXISTS {tabla}_tocado_{sufijo} AFTER {evento} ON {tabla} BEGIN "
+        + " ".join(f"INSERT OR IGNORE INTO dias_tocados (dia) VALUES ({r}.{col});" for r in filas)
+        + " END"
+        for tabla, col in (
+            ("comandas", "dia"), ("comanda_items", "dia"), ("gastos", "dia"), ("propinas", "dia"), ("cierres_caja", "fecha"),
+        )
+        for sufijo, evento, filas in (("ai", "INSERT", ("NEW",)), ("ad", "DELETE", ("OLD",)), ("au", "UPDATE", ("OLD", "NEW")))
+    ),
+)
+
+# Recalcula los rollups desde cero (misma lógica que los triggers)
+_REBUILD_ROLLUPS = (
+    "DELETE FROM rollup_ventas",
+    "DELETE FROM rollup_productos",
+    "DELETE FROM rollup_gastos",
+    "DELETE FROM rollup_propinas",
+    """
+    INSERT INTO rollup_ventas (dia, metodo_pago, mesero, total, num_comandas)
+    SELECT dia, COALESCE(metodo_pago, ''), COALESCE(NULLIF(TRIM(mesero), ''), 'SIN MESERO'), SUM(total), COUNT(*)
+    FROM comandas GROUP BY 1, 2, 3
+    """,
+    """
+    INSERT INTO rollup_productos (dia, producto, cantidad, subtotal, num_lineas)
+    SELECT dia, COALESCE(nombre_snapshot, 'SIN_NOMBRE'), SUM(cantidad), SUM(subtotal), COUNT(*)
+    FROM comanda_items GROUP BY 1, 2
+    """,
+    """
+    INSERT INTO rollup_gastos (dia, categoria, total, num_gastos)
+    SELECT dia, COALESCE(categoria, 'GENERAL'), SUM(monto), COUNT(*)
+    FROM gastos GROUP BY 1, 2
+    """,
+    """
+    INSERT INTO rollup_propinas (dia, mesero, total, num_propinas)
+    SELECT dia, COALESCE(NULLIF(TRIM(mesero_nombre_snapshot), ''), mesero_id, 'Sin nombre'), SUM(monto), COUNT(*)
+    FROM propinas GROUP BY 1, 2
+    """,
+)
+
+
+def _upsert(tabla: str, columnas: tuple[str, ...], llave: str) -> str:
+    # ON CONFLICT DO UPDATE y no INSERT OR REPLACE: REPLACE borra sin
+    # disparar los triggers de borrado y los rollups contarían doble. Una
+    # fila idéntica (la ventana de traslape del pull) no se reescribe: no
+    # toca rollups ni cuenta en rowcount.
+    marks = ", ".join("?" for _ in columnas)
+    resto = [c for c in columnas if c != llave]
+    sets = ", ".join(f"{c} = excluded.{c}" for c in resto)
+    cambio = f"({', '.join(resto)}) IS NOT ({', '.join(f'excluded.{c}' for c in resto)})"
+    return (
+        f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({marks}) "
+        f"ON CONFLICT ({llave}) DO UPDATE SET {sets} WHERE {cambio}"
+    )
+
+
+_UPSERT_COMANDA = _upsert(
+    "comandas",
+    ("id", "folio", "created_at", "dia", "hora", "metodo_pago", "total", "notas", "mesero", "recibido", "cambio", "status"),
+    "id",
+)
+_UPSERT_ITEM = _upsert(
+    "comanda_items",
+    ("uid", "comanda_id", "dia", "producto_id", "nombre_snapshot", "precio_unitario", "cantidad", "subtotal"),
+    "uid",
+)
+_UPSERT_GASTO = _upsert(
+    "gastos",
+    ("id", "created_at", "dia", "concepto", "categoria", "monto", "nota", "metodo_pago"),
+    "id",
+)
+_UPSERT_PROPINA = _upsert(
+    "propinas",
+    ("id", "fecha", "dia", "mesero_id", "mesero_nombre_snapshot", "monto", "fuente", "comanda_id", "created_at"),
+    "id",
+)
+_UPSERT_CIERRE = _upsert(
+    "cierres_caja",
+    ("id", "created_at", "fecha", "total_ventas", "total_gastos", "neto", "efectivo_reportado", "diferencia_efectivo", "notas"),
+    "id",
+)
+# Métricas del índice de sumas acumuladas, por día o por rango
+_SUMAS_POR_DIA = (
+    "SELECT 'metodo:' || metodo_pago, dia, SUM(total) FROM rollup_ventas WHERE {filtro} GROUP BY metodo_pago, dia "
+    "UNION ALL "
+    "SELECT 'mesero:' || mesero, dia, SUM(total) FROM rollup_ventas WHERE {filtro} GROUP BY mesero, dia "
+    "ORDER BY 2"
+)
+_SUMAS_RANGO = (
+    "SELECT 'metodo:' || metodo_pago, SUM(total) FROM rollup_ventas WHERE {filtro} GROUP BY metodo_pago "
+    "UNION ALL "
+    "SELECT 'mesero:' || mesero, SUM(total) FROM rollup_ventas WHERE {filtro} GROUP BY mesero"
+)
+_SELECT_STATE = "SELECT created_at, id FROM replica_state WHERE tabla = ?"
+# La marca de agua sólo avanza: una página que sólo trae filas del traslape
+# no la regresa.
+_UPSERT_STATE = (
+    "INSERT INTO replica_state (tabla, created_at, id, pulled_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (tabla) DO UPDATE SET pulled_at = excluded.pulled_at, "
+    "id = CASE WHEN excluded.created_at > created_at THEN excluded.id ELSE id END, "
+    "created_at = MAX(created_at, excluded.created_at)"
+)
+
+def use_local(backend: str | None) -> bool:
+    # None toma REPORTES_BACKEND; "local" agrega sobre app/data/replica.db
+    backend = backend or REPORTES_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"backend debe ser uno de {BACKENDS}")
+    return backend == "local"
+
+
+def _parse_ts(dt_str: str) -> datetime:
+    # Supabase puede devolver timestamps con sufijo Z u offsets sin ':'
+    dt_str = dt_str.strip()
+    if dt_str.endswith("Z"):
+        dt_str = dt_str[:-1] + "+00:00"
+    dt_str = re.sub(r"([+-])0\s+0:00$", r"\g<1>00:00", dt_str)
+    dt_str = re.sub(r"([+-]\d{2})\s?(\d{2})$", r"\1:\2", dt_str)
+    dt = datetime.fromisoformat(dt_str)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def _utc(dt_str: str) -> tuple[str, str, int]:
+    # (timestamp UTC con ancho fijo, día, hora): el día es el mismo criterio
+    # UTC que SupabaseService._day_range, así que ambos backends coinciden.
+    dt = _parse_ts(dt_str)
+    return dt.isoformat(timespec="microseconds"), dt.date().isoformat(), dt.hour
+
+
+def _opt_cents(value) -> Cents | None:
+    # Importes opcionales (recibido, cambio, precio): NULL se queda NULL
+    return None if value is None else to_cents(value)
+
+
+class LocalReplica:
+    """Copia local de solo lectura de las tablas de ventas para reportes.
+
+    Vive en `app/data/replica.db`, junto a la cola offline. `pull()` baja de
+    cada tabla lo posterior a su marca de agua (created_at) menos una ventana
+    de traslape, REPLICA_PULL_OVERLAP segundos, y lo inserta con upsert por
+    llave: una fila que otra transacción confirmó tarde, con created_at
+    anterior a la marca, entra en un pull siguiente, y repetir un pull es
+    inofensivo. Las ventas,
+    gastos y propinas de esta caja entran al guardarse (`apply_*`) y el pull
+    las reemplaza después con la fila del servidor.
+
+    Triggers mantienen rollups por día (ventas por método y mesero, productos,
+    gastos por categoría, propinas por mesero); los reportes por rango leen
+    esas tablas y no las filas crudas. Los cierres editados después de
+    copiarse no se vuelven a bajar.
+    """
+
+    def __init__(self, base_dir: str):
+        data_dir = os.path.join(base_dir, "data")
+        os.makedirs(data_dir, exist_ok=True)
+        self.db_path = os.path.join(data_dir, "replica.db")
+        self._local = threading.local()
+        self._init_db()
+
+    def _conn(self) -> sqlite3.Connection:
+        # Una conexión por hilo, igual que OfflineStore
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _init_db(self) -> None:
+        conn = self._conn()
+        with conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+                # Es una copia: con un esquema viejo se tira y el siguiente
+                # pull la vuelve a bajar completa.
+                tablas = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+                for (name,) in tablas:
+                    conn.execute(f"DROP TABLE IF EXISTS {name}")
+            for stmt in (*_SCHEMA, *_TRIGGERS):
+                conn.execute(stmt)
+            conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+    def rebuild_rollups(self) -> None:
+        conn = self._conn()
+        with conn:
+            for stmt in _REBUILD_ROLLUPS:
+                conn.execute(stmt)
+
+    # ---------------- Pull ----------------
+    def pull(self, db, page_size: int | None = None) -> int:
+        # db es un SupabaseService; se recibe como parámetro para no atar la
+        # réplica a un cliente (el hilo de sync usa el suyo).
+        copied = 0
+        for tabla in _SELECTS:
+            copied += self._pull_tabla(db, tabla, page_size)
+        return copied
+
+    def _pull_tabla(self, db, tabla: str, page_size: int | None) -> int:
+        state = self._conn().execute(_SELECT_STATE, (tabla,)).fetchone()
+
+        # Se relee desde la marca menos el traslape: created_at lo pone el
+        # server al empezar la transacción, así que una fila que se confirma
+        # tarde puede quedar detrás de la marca. El upsert descarta lo repetido.
+        desde = None
+        if state:
+            desde = (_parse_ts(state[0]) - timedelta(seconds=REPLICA_PULL_OVERLAP)).isoformat()
+
+        def build():
+            q = db.client.table(tabla).select(_SELECTS[tabla])
+            if desde:
+                q = q.gte("created_at", desde)
+            return q.order("created_at").order("id")
+
+        copied = 0
+        page: list[dict] = []
+        for row in db.iter_rows(build, page_size):
+            page.append(row)
+            if len(page) >= 500:
+                copied += self._store(tabla, page)
+                page = []
+        if page:
+            copied += self._store(tabla, page)
+        return copied
+
+    def _store(self, tabla: str, rows: list[dict]) -> int:
+        # Filas y marca de agua en la misma transacción: si el pull se corta
+        # a la mitad, el siguiente sigue desde la última página guardada.
+        # Regresa cuántas filas eran nuevas o cambiaron.
+        conn = self._conn()
+        with conn:
+            if tabla == "comandas":
+                cur = self._store_comandas(conn, rows)
+            elif tabla == "gastos":
+                cur = conn.executemany(_UPSERT_GASTO, [
+                    (r["id"], *_utc(r["created_at"])[:2], r.get("concepto"), r.get("categoria"),
+                     to_cents(r.get("monto")), r.get("nota"), r.get("metodo_pago"))
+                    for r in rows
+                ])
+            elif tabla == "propinas":
+                cur = conn.executemany(_UPSERT_PROPINA, [
+                    (r["id"], *_utc(r.get("fecha") or r["created_at"])[:2], r.get("mesero_id"),
+                     r.get("mesero_nombre_snapshot"), to_cents(r.get("monto")), r.get("fuente"),
+                     r.get("comanda_id"), r["created_at"])
+                    for r in rows
+                ])
+            else:
+                cur = conn.executemany(_UPSERT_CIERRE, [
+                    (r["id"], r["created_at"], r["fecha"], r.get("total_ventas"), r.get("total_gastos"),
+                     r.get("neto"), r.get("efectivo_reportado"), r.get("diferencia_efectivo"), r.get("notas"))
+                    for r in rows
+                ])
+            last = rows[-1]
+            conn.execute(_UPSERT_STATE, (tabla, _utc(last["created_at"])[0], str(last["id"]), datetime.now().isoformat(timespec="seconds")))
+        return max(cur.rowcount, 0)
+
+    def _store_comandas(self, conn: sqlite3.Connection, rows: list[dict]) -> sqlite3.Cursor:
+        comandas = []
+        items = []
+        for r in rows:
+            created_at, dia, hora = _utc(r["created_at"])
+            comandas.append((
+                r["id"], r.get("folio"), created_at, dia, hora, r.get("metodo_pago"),
+                to_cents(r.get("total")), r.get("notas"), r.get("mesero"),
+                _opt_cents(r.get("recibido")), _opt_cents(r.get("cambio")), r.get("status"),
+            ))
+            for it in r.get("comanda_items") or []:
+                items.append((
+                    it["uid"], r["id"], dia, it.get("producto_id"), it.get("nombre_snapshot"),
+                    _opt_cents(it.get("precio_unitario")), int(it.get("cantidad") or 0), to_cents(it.get("subtotal")),
+                ))
+        cur = conn.executemany(_UPSERT_COMANDA, comandas)
+        conn.executemany(_UPSERT_ITEM, items)
+        return cur
+
+    # ---------------- Escrituras locales ----------------
+    def apply_comanda(self, payload: dict) -> None:
+        # payload de SupabaseService.guardar_comanda (ids ya asignados). Se
+        # fecha con la hora local en UTC hasta que el pull traiga la del server.
+        created_at, dia, hora = _utc(datetime.now(timezone.utc).isoformat())
+        conn = self._conn()
+        with conn:
+            conn.execute(_UPSERT_COMANDA, (
+                payload["id"], None, created_at, dia, hora, payload.get("metodo_pago"),
+                to_cents(payload.get("total")), None, payload.get("mesero"),
+                _opt_cents(payload.get("recibido")), _opt_cents(payload.get("cambio")), "PAGADA",
+            ))
+            conn.executemany(_UPSERT_ITEM, [
+                (it["uid"], payload["id"], dia, it.get("producto_id"), it.get("nombre_snapshot"),
+                 _opt_cents(it.get("precio_unitario")), int(it.get("cantidad") or 0), to_cents(it.get("subtotal")))
+                for it in payload.get("items") or []
+            ])
+            if payload.get("propina") and payload.get("propina_id"):
+                conn.execute(_UPSERT_PROPINA, (
+                    payload["propina_id"], created_at, dia, None, payload.get("mesero") or "Sin nombre",
+                    to_cents(payload["propina"]), "COMANDA", payload["id"], created_at,
+                ))
+
+    def apply_gasto(self, data: dict) -> None:
+        created_at, dia, _ = _utc(datetime.now(timezone.utc).isoformat())
+        conn = self._conn()
+        with conn:
+            conn.execute(_UPSERT_GASTO, (
+                data["id"], created_at, dia, data.get("concepto"), data.get("categoria"),
+                to_cents(data.get("monto")), data.get("nota"), data.get("metodo_pago"),
+            ))
+
+    def apply_propina(self, data: dict) -> None:
+        created_at, dia, _ = _utc(datetime.now(timezone.utc).isoformat())
+        conn = self._conn()
+        with conn:
+            conn.execute(_UPSERT_PROPINA, (
+                data["id"], created_at, dia, data.get("mesero_id"), data.get("mesero_nombre_snapshot"),
+                to_cents(data.get("monto")), data.get("fuente"), data.get("comanda_id"), created_at,
+            ))
+
+    def discard(self, tipo: str, payload: dict) -> None:
+        # Quita lo que apply_* escribió para una op que el server rechazó
+        # para siempre (dead letter): los triggers de borrado corrigen los
+        # rollups, el índice acumulado y anotan el día en dias_tocados.
+        if tipo == "comanda":
+            borrar = [("comanda_items", "comanda_id", payload.get("id")), ("comandas", "id", payload.get("id"))]
+            if payload.get("propina_id"):
+                borrar.append(("propinas", "id", payload["propina_id"]))
+        elif tipo in ("gasto", "propina"):
+            borrar = [(f"{tipo}s", "id", payload.get("id"))]
+        else:
+            return
+        conn = self._conn()
+        with conn:
+            for tabla, llave, valor in borrar:
+                if valor is not None:
+                    conn.execute(f"DELETE FROM {tabla} WHERE {llave} = ?", (valor,))
+
+    def take_dias_tocados(self) -> list[str]:
+        # Días que cambiaron desde la última llamada; se vacían al leerse
+        conn = self._conn()
+        with conn:
+            dias = [d for (d,) in conn.execute("SELECT dia FROM dias_tocados")]
+            conn.execute("DELETE FROM dias_tocados")
+        return dias
+
+    def last_pull(self) -> datetime | None:
+        row = self._conn().execute("SELECT MAX(pulled_at) FROM replica_state").fetchone()
+        return datetime.fromisoformat(row[0]) if row and row[0] else None
+
+    # ---------------- Índice de sumas acumuladas ----------------
+    def extend_prefix(self, hasta: date | None = None) -> None:
+        # Agrega al índice los días cerrados (hasta ayer en UTC, el mismo
+        # criterio de día que _day_range) que aún no tiene. El día en curso
+        # nunca entra: todavía cambia con cada venta.
+        hasta = hasta or datetime.now(timezone.utc).date() - timedelta(days=1)
+        conn = self._conn()
+        row = conn.execute("SELECT hasta FROM prefix_state").fetchone()
+        desde = row[0] if row else None
+        if desde is not None and desde >= hasta.isoformat():
+            return
+        with conn:
+            acumulado = self._cum_at(desde) if desde else {}
+            nuevos = []
+            cur = conn.execute(
+                _SUMAS_POR_DIA.format(filtro="dia > ? AND dia <= ?"),
+                (desde or "", hasta.isoformat(), desde or "", hasta.isoformat()),
+            )
+            for metrica, dia, total in cur:
+                acumulado[metrica] = acumulado.get(metrica, 0) + int(total or 0)
+                nuevos.append((metrica, dia, acumulado[metrica]))
+            conn.executemany("INSERT OR REPLACE INTO cum_ventas (metrica, dia, acumulado) VALUES (?, ?, ?)", nuevos)
+            conn.executemany("INSERT OR IGNORE INTO cum_metricas (metrica) VALUES (?)", [(m,) for m in acumulado])
+            conn.execute("INSERT OR REPLACE INTO prefix_state (id, hasta) VALUES (1, ?)", (hasta.isoformat(),))
+
+    def _cum_at(self, dia: str) -> dict[str, Cents]:
+        # Acumulado de cada métrica al cierre de `dia`: una búsqueda por
+        # índice por métrica, sin importar cuántos días abarque el índice.
+        rows = self._rows(
+            "SELECT metrica, (SELECT acumulado FROM cum_ventas c WHERE c.metrica = m.metrica AND c.dia <= ? "
+            "ORDER BY c.dia DESC LIMIT 1) FROM cum_metricas m",
+            (dia,),
+        )
+        return {m: int(v) for m, v in rows if v is not None}
+
+    def _sumas_rango(self, desde: date, hasta: date) -> dict[str, Cents]:
+        # Días cerrados: cum[fin] - cum[inicio - 1]; lo que quede después de la
+        # frontera del índice sale de los rollups. Sólo lee: el índice lo
+        # extiende el hilo de sync después de cada pull, y si va atrasado los
+        # días que faltan también salen de los rollups.
+        conn = self._conn()
+        ini, fin = desde.isoformat(), hasta.isoformat()
+        sumas: dict[str, Cents] = {}
+        # Una transacción de lectura: frontera e índice de la misma versión
+        # aunque el hilo de sync lo esté extendiendo o truncando.
+        with conn:
+            conn.execute("BEGIN")
+            row = conn.execute("SELECT hasta FROM prefix_state").fetchone()
+            frontera = row[0] if row else ""
+            resto = ini
+            if ini <= frontera:
+                antes = self._cum_at((desde - timedelta(days=1)).isoformat())
+                for metrica, valor in self._cum_at(min(fin, frontera)).items():
+                    sumas[metrica] = valor - antes.get(metrica, 0)
+                resto = (date.fromisoformat(frontera) + timedelta(days=1)).isoformat()
+            if resto <= fin:
+                for metrica, total in self._rows(
+                    _SUMAS_RANGO.format(filtro="dia BETWEEN ? AND ?"), (resto, fin, resto, fin)
+                ):
+                    sumas[metrica] = sumas.get(metrica, 0) + int(total or 0)
+        return sumas
+
+    # ---------------- Consultas ----------------
+    def _rows(self, sql: str, params: Iterable) -> list[tuple]:
+        return self._conn().execute(sql, tuple(params)).fetchall()
+
+    def iter_query(self, sql: str, params: Iterable, chunk: int = 500) -> Iterator[tuple]:
+        # Recorre el cursor por bloques: memoria constante en exportaciones
+        cur = self._conn().execute(sql, tuple(params))
+        while True:
+            rows = cur.fetchmany(chunk)
+            if not rows:
+                return
+            yield from rows
+
+    # Los importes de las consultas salen en centavos (Cents), salvo
+    # top_productos, que ya regresa pesos como el resultado de reportes.
+    def ventas_por_dia(self, desde: date, hasta: date) -> dict[str, Cents]:
+        rows = self._rows(
+            "SELECT dia, SUM(total) FROM rollup_ventas WHERE dia BETWEEN ? AND ? GROUP BY dia",
+            (desde.isoformat(), hasta.isoformat()),
+        )
+        return {dia: int(total or 0) for dia, total in rows}
+
+    def ventas_por_metodo(self, desde: date, hasta: date) -> dict[str, Cents]:
+        return self._por_prefijo("metodo:", desde, hasta)
+
+    def ventas_por_mesero(self, desde: date, hasta: date) -> dict[str, Cents]:
+        return self._por_prefijo("mesero:", desde, hasta)
+
+    def _por_prefijo(self, prefijo: str, desde: date, hasta: date) -> dict[str, Cents]:
+        # Las métricas sin ventas en el rango (diferencia 0) no se reportan
+        return {
+            metrica[len(prefijo):]: total
+            for metrica, total in self._sumas_rango(desde, hasta).items()
+            if metrica.startswith(prefijo) and total != 0
+        }
+
+    def ventas_por_hora(self, dia: date) -> dict[int, tuple[Cents, int]]:
+        rows = self._rows(
+            "SELECT hora, SUM(total), COUNT(*) FROM comandas WHERE dia = ? GROUP BY hora",
+            (dia.isoformat(),),
+        )
+        return {hora: (int(total or 0), int(n)) for hora, total, n in rows}
+
+    def top_productos(self, desde: date, hasta: date, limit: int = 10) -> list[dict]:
+        rows = self._rows(
+            "SELECT producto, SUM(cantidad), SUM(subtotal) AS st "
+            "FROM rollup_productos WHERE dia BETWEEN ? AND ? GROUP BY producto ORDER BY st DESC, producto LIMIT ?",
+            (desde.isoformat(), hasta.isoformat(), limit if limit and limit > 0 else -1),
+        )
+        return [{"producto": p, "cantidad_total": c, "subtotal_total": to_pesos(s or 0)} for p, c, s in rows]
+
+    def gastos_total(self, desde: date, hasta: date) -> Cents:
+        row = self._rows("SELECT SUM(total) FROM rollup_gastos WHERE dia BETWEEN ? AND ?", (desde.isoformat(), hasta.isoformat()))[0]
+        return int(row[0] or 0)
+
+    def propinas_total(self, desde: date, hasta: date) -> Cents:
+        row = self._rows("SELECT SUM(total) FROM rollup_propinas WHERE dia BETWEEN ? AND ?", (desde.isoformat(), hasta.isoformat()))[0]
+        return int(row[0] or 0)
+
+    def dias_con_cierre(self, desde: date, hasta: date) -> int:
+        row = self._rows(
+            "SELECT COUNT(DISTINCT fecha) FROM cierres_caja WHERE fecha BETWEEN ? AND ?",
+            (desde.isoformat(), hasta.isoformat()),
+        )[0]
+        return int(row[0] or 0)
+
+    def cierre(self, fecha: date) -> dict | None:
+        cur = self._conn().execute(
+            "SELECT * FROM cierres_caja WHERE fecha = ? ORDER BY created_at DESC LIMIT 1", (fecha.isoformat(),)
+        )
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return {col[0]: value for col, value in zip(cur.description, row)}
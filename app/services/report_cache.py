@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, time as dtime, timedelta, timezone
+from typing import Callable
+
+from .replica import use_local
+from .settings import REPORT_CACHE_DISK, REPORT_CACHE_DISK_MAX, REPORT_CACHE_SIZE, REPORT_CACHE_TTL
+
+
+class ReportCache:
+    """Caché de resultados de reportes por (nombre, rango, parámetros).
+
+    En memoria con desalojo LRU. Un resultado cuyos días ya están todos
+    cerrados es inmutable: no expira y, si hay `disk_dir`, también se guarda
+    en disco (a lo más `max_disk_files` archivos, se borran los menos usados)
+    para sobrevivir reinicios. Los demás viven `ttl` segundos o hasta que una
+    escritura invalide su rango; `forget` tira también los inmutables de un
+    día que cambió después de todo. Los valores se guardan como JSON: cada
+    lectura entrega una copia nueva.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl: float = 60.0,
+        disk_dir: str | None = None,
+        max_disk_files: int = 500,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.max_disk_files = max_disk_files
+        # key -> (json, desde, hasta, expira); expira None = inmutable
+        self._mem: OrderedDict[str, tuple[str, date, date, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get_or_compute(
+        self,
+        key: str,
+        desde: date,
+        hasta: date,
+        compute: Callable[[], object],
+        inmutable: Callable[[], bool] = lambda: False,
+    ):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None and (entry[3] is None or entry[3] > now):
+                self._mem.move_to_end(key)
+                return json.loads(entry[0])
+
+        data = self._read_disk(key, desde, hasta)
+        if data is not None:
+            self._put(key, data, desde, hasta, None)
+            return json.loads(data)
+
+        value = compute()
+        try:
+            data = json.dumps(value, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return value
+        if inmutable():
+            self._put(key, data, desde, hasta, None)
+            self._write_disk(key, desde, hasta, data)
+        else:
+            self._put(key, data, desde, hasta, time.monotonic() + self.ttl)
+        return value
+
+    def invalidate(self, dia: date | None = None) -> None:
+        # Sólo se tiran entradas mutables: las inmutables no pueden contener
+        # días abiertos. Sin `dia` se tiran todas las mutables.
+        with self._lock:
+            for key in [
+                k for k, (_, desde, hasta, expira) in self._mem.items()
+                if expira is not None and (dia is None or desde <= dia <= hasta)
+            ]:
+                del self._mem[key]
+
+    def forget(self, dia: date) -> None:
+        # Un día cambió en la réplica (pull, venta, dead letter, cierre
+        # editado): se tira todo lo que lo incluye, inmutable o no, y en disco.
+        with self._lock:
+            for key in [k for k, (_, desde, hasta, _) in self._mem.items() if desde <= dia <= hasta]:
+                del self._mem[key]
+        for name, desde, hasta in self._disk_files():
+            if desde <= dia <= hasta:
+                self._remove(name)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+
+    def _put(self, key: str, data: str, desde: date, hasta: date, expira: float | None) -> None:
+        with self._lock:
+            self._mem[key] = (data, desde, hasta, expira)
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+
+    def _path(self, key: str, desde: date, hasta: date) -> str:
+        # El rango va en el nombre para que forget() no tenga que abrir archivos
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, f"{desde.isoformat()}_{hasta.isoformat()}_{digest}.json")
+
+    def _read_disk(self, key: str, desde: date, hasta: date) -> str | None:
+        if not self.disk_dir:
+            return None
+        path = self._path(key, desde, hasta)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = f.read()
+            # mtime = último uso: la poda borra primero lo que no se lee
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def _write_disk(self, key: str, desde: date, hasta: date, data: str) -> None:
+        if not self.disk_dir:
+            return
+        path = self._path(key, desde, hasta)
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            # El disco es sólo un segundo nivel: sin él se sigue en memoria
+            return
+        self._prune_disk()
+
+    def _disk_files(self) -> list[tuple[str, date, date]]:
+        # (archivo, desde, hasta) de cada entrada en disco con nombre válido
+        if not self.disk_dir:
+            return []
+        files = []
+        try:
+            names = os.listdir(self.disk_dir)
+        except OSError:
+            return []
+        for name in names:
+            parts = name.split("_")
+            if len(parts) != 3 or not name.endswith(".json"):
+                continue
+            try:
+                files.append((name, date.fromisoformat(parts[0]), date.fromisoformat(parts[1])))
+            except ValueError:
+                continue
+        return files
+
+    def _prune_disk(self) -> None:
+        # Tope de archivos: se borran los de uso más viejo. Los de nombre sin
+        # rango (versiones previas) se borran siempre; los .tmp pueden ser
+        # una escritura en curso de otro hilo y se dejan.
+        try:
+            names = os.listdir(self.disk_dir)
+        except OSError:
+            return
+        validos = {name for name, _, _ in self._disk_files()}
+        for name in names:
+            if name not in validos and not name.endswith(".tmp"):
+                self._remove(name)
+        if len(validos) <= self.max_disk_files:
+            return
+        por_uso = []
+        for name in validos:
+            try:
+                por_uso.append((os.path.getmtime(os.path.join(self.disk_dir, name)), name))
+            except OSError:
+                continue
+        por_uso.sort()
+        for _, name in por_uso[: len(por_uso) - self.max_disk_files]:
+            self._remove(name)
+
+    def _remove(self, name: str) -> None:
+        try:
+            os.remove(os.path.join(self.disk_dir, name))
+        except OSError:
+            pass
+
+
+_base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Una sola caché por proceso: la UI y el hilo de sync comparten invalidaciones
+report_cache = ReportCache(
+    max_entries=REPORT_CACHE_SIZE,
+    ttl=REPORT_CACHE_TTL,
+    disk_dir=os.path.join(_base_dir, "data", "report_cache") if REPORT_CACHE_DISK else None,
+    max_disk_files=REPORT_CACHE_DISK_MAX,
+)
+
+
+def today_utc() -> date:
+    # Mismo criterio de día que SupabaseService._day_range
+    return datetime.now(timezone.utc).date()
+
+
+def _cerrado(db, desde: date, hasta: date) -> bool:
+    # Un rango es inmutable si termina antes de hoy, cada uno de sus días
+    # tiene cierre de caja en la réplica local (sin tocar la red) y la cola
+    # offline no guarda ops de esos días que aún puedan llegar. created_at
+    # de la cola es hora local: un día de margen cubre el desfase con UTC.
+    if db is None or hasta >= today_utc():
+        return False
+    try:
+        if db.replica.dias_con_cierre(desde, hasta) < (hasta - desde).days + 1:
+            return False
+        return not db.offline.has_ops_before(datetime.combine(hasta + timedelta(days=2), dtime.min))
+    except Exception:
+        return False
+
+
+def cached_report(nombre: str):
+    """Decora una función de reporte `(fecha | fecha_inicio, fecha_fin, ..., db, backend)`.
+
+    La llave es el nombre, el rango y los demás parámetros (sin `db`), con
+    `backend` ya resuelto: lo calculado desde Supabase no se sirve si
+    REPORTES_BACKEND cambia a local, ni al revés.
+    """
+
+    def decorator(fn):
+        sig = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            # db y backend se resuelven aquí (y así se le pasan a `fn`): sin
+            # db no se podría consultar el cierre para marcar inmutable.
+            # registry se importa tarde: importa supabase_service, que a su
+            # vez importa este módulo.
+            from .registry import get_service
+
+            db = bound.arguments["db"] = bound.arguments.get("db") or get_service()
+            if "backend" in bound.arguments:
+                bound.arguments["backend"] = "local" if use_local(bound.arguments["backend"]) else "supabase"
+            params = dict(bound.arguments)
+            params.pop("db")
+            if "fecha" in params:
+                desde = hasta = params.pop("fecha")
+            else:
+                desde = params.pop("fecha_inicio")
+                hasta = params.pop("fecha_fin")
+            key = json.dumps([nombre, desde.isoformat(), hasta.isoformat(), params], sort_keys=True, default=str)
+            return report_cache.get_or_compute(
+                key, desde, hasta, lambda: fn(*bound.args, **bound.kwargs), inmutable=lambda: _cerrado(db, desde, hasta)
+            )
+
+        return wrapper
+
+    return decorator
@@ -4,11 +4,18 @@ from datetime import date, datetime
 import re
 from typing import Iterable
 
+from domain.corte import calc_ventas_por_metodo, resumen_por_metodo
+from domain.money import to_cents, to_pesos
+from .replica import use_local
+from .report_cache import cached_report
+from .reportes_service import get_top_productos
+from .registry import get_service
 from .supabase_service import SupabaseService
 
 
 def _get_db(db: SupabaseService | None) -> SupabaseService:
-    return db or SupabaseService()
+    # Sin db explícito se usa el servicio compartido del proceso
+    return db or get_service()
 
 
 def _parse_iso(dt_str: str) -> datetime:
@@ -23,107 +30,72 @@ def _parse_iso(dt_str: str) -> datetime:
     return datetime.fromisoformat(dt_str)
 
 
-def resumen_ventas_por_metodo(fecha: date, db: SupabaseService | None = None) -> dict:
+@cached_report("resumen_ventas_por_metodo")
+def resumen_ventas_por_metodo(fecha: date, db: SupabaseService | None = None, backend: str | None = None) -> dict:
     db = _get_db(db)
     desde, hasta = db._day_range(fecha)
 
-    rows = (
-        db.client.table("comandas")
+    if use_local(backend):
+        # Mismas llaves que la rama de Supabase; la réplica ya da centavos
+        resumen = resumen_por_metodo(db.replica.ventas_por_metodo(fecha, fecha))
+        return {k: to_pesos(v) for k, v in resumen.items()}
+
+    rows = db.iter_rows(
+        lambda: db.client.table("comandas")
         .select("total, metodo_pago")
         .gte("created_at", desde)
         .lte("created_at", hasta)
-        .execute()
-    ).data or []
+        .order("created_at")
+        .order("id")
+    )
 
-    resumen = {"EFECTIVO": 0.0, "TARJETA": 0.0, "TRANSFER": 0.0, "total": 0.0}
-    for r in rows:
-        total = float(r.get("total") or 0)
-        metodo = r.get("metodo_pago") or ""
-        if metodo in resumen:
-            resumen[metodo] += total
-        resumen["total"] += total
+    return calc_ventas_por_metodo(rows)
 
-    for k in ("EFECTIVO", "TARJETA", "TRANSFER", "total"):
-        resumen[k] = round(float(resumen[k]), 2)
-    return resumen
 
+def top_productos(fecha: date, limit: int = 10, db: SupabaseService | None = None, backend: str | None = None) -> list[dict]:
+    return get_top_productos(fecha, fecha, limit=limit, db=db, backend=backend)
 
-def top_productos(fecha: date, limit: int = 10, db: SupabaseService | None = None) -> list[dict]:
-    db = _get_db(db)
-    desde, hasta = db._day_range(fecha)
 
-    comandas = (
-        db.client.table("comandas")
-        .select("id")
-        .gte("created_at", desde)
-        .lte("created_at", hasta)
-        .execute()
-    ).data or []
-
-    comanda_ids = [c["id"] for c in comandas]
-    if not comanda_ids:
-        return []
-
-    items = (
-        db.client.table("comanda_items")
-        .select("nombre_snapshot, cantidad, subtotal, comanda_id")
-        .in_("comanda_id", comanda_ids)
-        .execute()
-    ).data or []
-
-    agg: dict[str, dict] = {}
-    for it in items:
-        nombre = it.get("nombre_snapshot") or "SIN_NOMBRE"
-        if nombre not in agg:
-            agg[nombre] = {
-                "producto": nombre,
-                "cantidad_total": 0,
-                "subtotal_total": 0.0,
-            }
-        agg[nombre]["cantidad_total"] += int(it.get("cantidad") or 0)
-        agg[nombre]["subtotal_total"] += float(it.get("subtotal") or 0)
-
-    result = list(agg.values())
-    result.sort(key=lambda x: (-x["subtotal_total"], x["producto"]))
-    if limit is not None and limit > 0:
-        result = result[:limit]
-    for r in result:
-        r["subtotal_total"] = round(float(r["subtotal_total"]), 2)
-    return result
-
-
-def ventas_por_hora(fecha: date, db: SupabaseService | None = None) -> list[dict]:
+@cached_report("ventas_por_hora")
+def ventas_por_hora(fecha: date, db: SupabaseService | None = None, backend: str | None = None) -> list[dict]:
     db = _get_db(db)
     desde, hasta = db._day_range(fecha)
 
-    rows = (
-        db.client.table("comandas")
+    if use_local(backend):
+        por_hora = db.replica.ventas_por_hora(fecha)
+        return [
+            {"hora": h, "total": to_pesos(por_hora.get(h, (0, 0))[0]), "num_comandas": por_hora.get(h, (0, 0))[1]}
+            for h in range(24)
+        ]
+
+    rows = db.iter_rows(
+        lambda: db.client.table("comandas")
         .select("created_at, total")
         .gte("created_at", desde)
         .lte("created_at", hasta)
         .order("created_at")
-        .execute()
-    ).data or []
+        .order("id")
+    )
 
-    # Inicializa 24 horas
-    horas = [{"hora": h, "total": 0.0, "num_comandas": 0} for h in range(24)]
+    # Las 24 horas en cero; los totales van en centavos mientras se acumulan
+    horas = [{"hora": h, "total": 0, "num_comandas": 0} for h in range(24)]
     for r in rows:
         created_at = r.get("created_at")
         if not created_at:
             continue
         dt = _parse_iso(created_at)
         h = dt.hour
-        horas[h]["total"] += float(r.get("total") or 0)
+        horas[h]["total"] += to_cents(r.get("total"))
         horas[h]["num_comandas"] += 1
 
     for h in horas:
-        h["total"] = round(float(h["total"]), 2)
+        h["total"] = to_pesos(h["total"])
     return horas
 
 
 def demo_reportes(fecha: date | None = None) -> None:
     fecha = fecha or date.today()
-    db = SupabaseService()
+    db = get_service()
 
     print(f"== Reportes para {fecha.isoformat()} ==")
     print("Resumen por metodo:", resumen_ventas_por_metodo(fecha, db=db))
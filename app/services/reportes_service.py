@@ -3,11 +3,17 @@ from __future__ import annotations
 from datetime import date, datetime
 import re
 
+from domain.corte import resumen_por_metodo
+from domain.money import Cents, to_cents, to_pesos
+from .replica import use_local
+from .report_cache import cached_report
+from .registry import get_service
 from .supabase_service import SupabaseService
 
 
 def _get_db(db: SupabaseService | None) -> SupabaseService:
-    return db or SupabaseService()
+    # Sin db explícito se usa el servicio compartido del proceso
+    return db or get_service()
 
 
 def _parse_iso(dt_str: str) -> datetime:
@@ -43,134 +49,200 @@ def _range_iso(db: SupabaseService, fecha_inicio: date, fecha_fin: date) -> tupl
     return desde, hasta
 
 
+@cached_report("top_productos")
 def get_top_productos(
     fecha_inicio: date,
     fecha_fin: date,
     limit: int = 10,
     db: SupabaseService | None = None,
+    backend: str | None = None,
 ) -> list[dict]:
     db = _get_db(db)
     desde, hasta = _range_iso(db, fecha_inicio, fecha_fin)
-
-    comandas = (
-        db.client.table("comandas")
-        .select("id")
-        .gte("created_at", desde)
-        .lte("created_at", hasta)
-        .execute()
-    ).data or []
-
-    comanda_ids = [c["id"] for c in comandas]
-    if not comanda_ids:
-        return []
-
-    items = (
-        db.client.table("comanda_items")
-        .select("nombre_snapshot, cantidad, subtotal, comanda_id")
-        .in_("comanda_id", comanda_ids)
-        .execute()
+    if use_local(backend):
+        rows = db.replica.top_productos(fecha_inicio, fecha_fin, limit)
+        return _top_productos_result(rows)
+
+    # Se agrupa en Postgres (sql/reportes.sql): sólo viajan las top-N filas
+    rows = db.execute(
+        db.client.rpc(
+            "top_productos",
+            {"p_desde": desde, "p_hasta": hasta, "p_limit": limit if limit and limit > 0 else 0},
+        )
     ).data or []
 
-    agg: dict[str, dict] = {}
-    for it in items:
-        nombre = it.get("nombre_snapshot") or "SIN_NOMBRE"
-        if nombre not in agg:
-            agg[nombre] = {"producto": nombre, "cantidad_total": 0, "subtotal_total": 0.0}
-        agg[nombre]["cantidad_total"] += int(it.get("cantidad") or 0)
-        agg[nombre]["subtotal_total"] += float(it.get("subtotal") or 0)
-
-    result = list(agg.values())
-    result.sort(key=lambda x: (-x["subtotal_total"], x["producto"]))
-    if limit is not None and limit > 0:
-        result = result[:limit]
-    for r in result:
-        r["subtotal_total"] = round(float(r["subtotal_total"]), 2)
-    return result
+    return _top_productos_result(rows)
 
 
+@cached_report("ventas_por_dia")
 def get_ventas_por_dia(
     fecha_inicio: date,
     fecha_fin: date,
     db: SupabaseService | None = None,
+    backend: str | None = None,
 ) -> list[dict]:
     db = _get_db(db)
     desde, hasta = _range_iso(db, fecha_inicio, fecha_fin)
+    if use_local(backend):
+        return _ventas_por_dia_result(db.replica.ventas_por_dia(fecha_inicio, fecha_fin))
 
-    rows = (
-        db.client.table("comandas")
+    rows = db.iter_rows(
+        lambda: db.client.table("comandas")
         .select("created_at, total")
         .gte("created_at", desde)
         .lte("created_at", hasta)
         .order("created_at")
-        .execute()
-    ).data or []
+        .order("id")
+    )
 
-    agg: dict[str, float] = {}
+    agg: dict[str, Cents] = {}
     for r in rows:
         created_at = r.get("created_at")
         key = _extract_date_key(created_at)
         if not key:
             continue
-        agg[key] = agg.get(key, 0.0) + float(r.get("total") or 0)
+        agg[key] = agg.get(key, 0) + to_cents(r.get("total"))
 
-    result = [{"fecha": k, "total": round(v, 2)} for k, v in agg.items()]
-    result.sort(key=lambda x: x["fecha"])
-    return result
+    return _ventas_por_dia_result(agg)
 
 
+@cached_report("ventas_por_metodo")
 def get_ventas_por_metodo(
     fecha_inicio: date,
     fecha_fin: date,
     db: SupabaseService | None = None,
+    backend: str | None = None,
 ) -> dict:
     db = _get_db(db)
     desde, hasta = _range_iso(db, fecha_inicio, fecha_fin)
+    if use_local(backend):
+        return _ventas_por_metodo_result(resumen_por_metodo(db.replica.ventas_por_metodo(fecha_inicio, fecha_fin)))
 
-    rows = (
-        db.client.table("comandas")
+    rows = db.iter_rows(
+        lambda: db.client.table("comandas")
         .select("total, metodo_pago")
         .gte("created_at", desde)
         .lte("created_at", hasta)
-        .execute()
-    ).data or []
+        .order("created_at")
+        .order("id")
+    )
 
-    resumen = {"EFECTIVO": 0.0, "TARJETA": 0.0, "TRANSFER": 0.0, "total": 0.0}
+    por_metodo: dict[str, Cents] = {}
     for r in rows:
-        total = float(r.get("total") or 0)
         metodo = r.get("metodo_pago") or ""
-        if metodo in resumen:
-            resumen[metodo] += total
-        resumen["total"] += total
-
-    for k in ("EFECTIVO", "TARJETA", "TRANSFER", "total"):
-        resumen[k] = round(float(resumen[k]), 2)
-    return resumen
+        por_metodo[metodo] = por_metodo.get(metodo, 0) + to_cents(r.get("total"))
+    return _ventas_por_metodo_result(resumen_por_metodo(por_metodo))
 
 
+@cached_report("ventas_por_mesero")
 def get_ventas_por_mesero(
     fecha_inicio: date,
     fecha_fin: date,
     limit: int = 8,
     db: SupabaseService | None = None,
+    backend: str | None = None,
 ) -> list[dict]:
     db = _get_db(db)
     desde, hasta = _range_iso(db, fecha_inicio, fecha_fin)
+    if use_local(backend):
+        return _ventas_por_mesero_result(db.replica.ventas_por_mesero(fecha_inicio, fecha_fin), limit)
 
-    rows = (
-        db.client.table("comandas")
+    rows = db.iter_rows(
+        lambda: db.client.table("comandas")
         .select("mesero, total")
         .gte("created_at", desde)
         .lte("created_at", hasta)
-        .execute()
-    ).data or []
+        .order("created_at")
+        .order("id")
+    )
+
+    agg: dict[str, Cents] = {}
+    for r in rows:
+        mesero = _mesero_key(r.get("mesero"))
+        agg[mesero] = agg.get(mesero, 0) + to_cents(r.get("total"))
+    return _ventas_por_mesero_result(agg, limit)
+
+
+@cached_report("reporte_ventas")
+def get_reporte_ventas(
+    fecha_inicio: date,
+    fecha_fin: date,
+    top_limit: int = 10,
+    mesero_limit: int = 8,
+    db: SupabaseService | None = None,
+    backend: str | None = None,
+) -> dict:
+    # Todos los reportes de la pantalla en dos peticiones: las columnas de
+    # comandas se bajan una vez y se agregan en una pasada (día, método,
+    # mesero); el top de productos sale del RPC. Mismas formas que las
+    # funciones individuales.
+    db = _get_db(db)
+    desde, hasta = _range_iso(db, fecha_inicio, fecha_fin)
+    if use_local(backend):
+        return {
+            "top_productos": get_top_productos(fecha_inicio, fecha_fin, limit=top_limit, db=db, backend="local"),
+            "ventas_por_dia": get_ventas_por_dia(fecha_inicio, fecha_fin, db=db, backend="local"),
+            "ventas_por_metodo": get_ventas_por_metodo(fecha_inicio, fecha_fin, db=db, backend="local"),
+            "ventas_por_mesero": get_ventas_por_mesero(fecha_inicio, fecha_fin, limit=mesero_limit, db=db, backend="local"),
+        }
+
+    rows = db.iter_rows(
+        lambda: db.client.table("comandas")
+        .select("created_at, total, metodo_pago, mesero")
+        .gte("created_at", desde)
+        .lte("created_at", hasta)
+        .order("created_at")
+        .order("id")
+    )
 
-    agg: dict[str, float] = {}
+    # Acumulados en centavos: la suma es exacta y cada monto se convierte una vez
+    por_dia: dict[str, Cents] = {}
+    por_metodo: dict[str, Cents] = {}
+    por_mesero: dict[str, Cents] = {}
     for r in rows:
-        mesero = (r.get("mesero") or "SIN MESERO").strip() or "SIN MESERO"
-        agg[mesero] = agg.get(mesero, 0.0) + float(r.get("total") or 0)
+        total = to_cents(r.get("total"))
+        key = _extract_date_key(r.get("created_at"))
+        if key:
+            por_dia[key] = por_dia.get(key, 0) + total
+        metodo = r.get("metodo_pago") or ""
+        por_metodo[metodo] = por_metodo.get(metodo, 0) + total
+        mesero = _mesero_key(r.get("mesero"))
+        por_mesero[mesero] = por_mesero.get(mesero, 0) + total
+
+    return {
+        "top_productos": get_top_productos(fecha_inicio, fecha_fin, limit=top_limit, db=db, backend="supabase"),
+        "ventas_por_dia": _ventas_por_dia_result(por_dia),
+        "ventas_por_metodo": _ventas_por_metodo_result(resumen_por_metodo(por_metodo)),
+        "ventas_por_mesero": _ventas_por_mesero_result(por_mesero, mesero_limit),
+    }
+
+
+def _mesero_key(mesero: str | None) -> str:
+    return (mesero or "SIN MESERO").strip() or "SIN MESERO"
+
+
+def _top_productos_result(rows: list[dict]) -> list[dict]:
+    return [
+        {
+            "producto": r.get("producto") or "SIN_NOMBRE",
+            "cantidad_total": int(r.get("cantidad_total") or 0),
+            "subtotal_total": to_pesos(to_cents(r.get("subtotal_total"))),
+        }
+        for r in rows
+    ]
+
+
+# Los *_result reciben centavos y son el único punto donde se vuelve a pesos
+def _ventas_por_dia_result(agg: dict[str, Cents]) -> list[dict]:
+    return [{"fecha": k, "total": to_pesos(agg[k])} for k in sorted(agg)]
+
+
+def _ventas_por_metodo_result(resumen: dict[str, Cents]) -> dict:
+    return {k: to_pesos(v) for k, v in resumen.items()}
+
 
-    result = [{"mesero": k, "total": round(v, 2)} for k, v in agg.items()]
-    result.sort(key=lambda x: (-x["total"], x["mesero"]))
+def _ventas_por_mesero_result(agg: dict[str, Cents], limit: int | None) -> list[dict]:
+    orden = sorted(agg.items(), key=lambda kv: (-kv[1], kv[0]))
     if limit is not None and limit > 0:
-        result = result[:limit]
-    return result
+        orden = orden[:limit]
+    return [{"mesero": k, "total": to_pesos(v)} for k, v in orden]
@@ -8,3 +8,40 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise RuntimeError("Falta SUPABASE_URL o SUPABASE_KEY en el archivo .env")
+
+# Tamaño de bloque para reenviar la cola offline (inserts multi-fila)
+SYNC_BATCH_SIZE = int(os.getenv("SYNC_BATCH_SIZE", "50"))
+
+# Timeouts (segundos) de las llamadas a Supabase y del probe de conexión
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "3"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+SUPABASE_PROBE_TIMEOUT = float(os.getenv("SUPABASE_PROBE_TIMEOUT", "2"))
+
+# Circuit breaker: fallas seguidas para abrir y segundos antes de re-probar
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "2"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "15"))
+
+# Intervalos del sync offline (segundos): mínimo con pendientes, máximo en
+# reposo o tras varios fallos seguidos.
+SYNC_MIN_INTERVAL = float(os.getenv("SYNC_MIN_INTERVAL", "5"))
+SYNC_MAX_INTERVAL = float(os.getenv("SYNC_MAX_INTERVAL", "300"))
+
+# Filas por página en lecturas por rango; no debe exceder el max-rows del
+# servidor (1000 por defecto en Supabase) o las páginas se cortan.
+SUPABASE_PAGE_SIZE = int(os.getenv("SUPABASE_PAGE_SIZE", "1000"))
+
+# Réplica local para reportes: cada cuánto (segundos) el hilo de sync baja lo
+# nuevo y qué backend usan por defecto reportes y corte ("supabase" o "local").
+# Cada pull relee REPLICA_PULL_OVERLAP segundos antes de la marca de agua para
+# alcanzar filas que otras transacciones confirmaron tarde.
+REPLICA_PULL_INTERVAL = float(os.getenv("REPLICA_PULL_INTERVAL", "60"))
+REPLICA_PULL_OVERLAP = float(os.getenv("REPLICA_PULL_OVERLAP", "600"))
+REPORTES_BACKEND = os.getenv("REPORTES_BACKEND", "supabase")
+
+# Caché de reportes: entradas en memoria (LRU), vida en segundos de las que
+# incluyen días abiertos, si los rangos ya cerrados se guardan en disco y
+# cuántos archivos se conservan ahí como máximo.
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "256"))
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", "60"))
+REPORT_CACHE_DISK = os.getenv("REPORT_CACHE_DISK", "1") == "1"
+REPORT_CACHE_DISK_MAX = int(os.getenv("REPORT_CACHE_DISK_MAX", "500"))
@@ -1,22 +1,92 @@
 from datetime import date, datetime, time, timezone
 import os
-from supabase import create_client
-from .settings import SUPABASE_URL, SUPABASE_KEY
+from typing import Callable, Iterator
+import httpx
+from supabase import ClientOptions, create_client
+from domain.money import to_cents, to_pesos
+from .settings import (
+    BREAKER_COOLDOWN,
+    BREAKER_FAILURES,
+    SUPABASE_CONNECT_TIMEOUT,
+    SUPABASE_KEY,
+    SUPABASE_PAGE_SIZE,
+    SUPABASE_PROBE_TIMEOUT,
+    SUPABASE_TIMEOUT,
+    SUPABASE_URL,
+    SYNC_BATCH_SIZE,
+)
+from .health import BackendUnavailableError, CircuitBreaker, is_connection_error, is_permanent_error
+from .ids import uuid7
 from .offline_store import OfflineStore
+from .replica import LocalReplica
+from .report_cache import report_cache, today_utc
+
+
+# Tabla destino de cada tipo de operación que se inserta tal cual
+OFFLINE_TABLES = {
+    "gasto": "gastos",
+    "propina": "propinas",
+    "cierre": "cierres_caja",
+}
+
+# Orden de reenvío dentro de un bloque: las comandas primero porque las
+# propinas y el cierre del día dependen de ellas.
+OFFLINE_ORDER = ("comanda", "gasto", "propina", "cierre")
 
 
 class SupabaseService:
     def __init__(self):
-        self.client = create_client(SUPABASE_URL, SUPABASE_KEY)
+        timeout = httpx.Timeout(SUPABASE_TIMEOUT, connect=SUPABASE_CONNECT_TIMEOUT)
+        self.client = create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(postgrest_client_timeout=timeout))
+        # Cliente HTTP/2 persistente para el probe del breaker: la conexión se
+        # reutiliza entre probes en vez de abrir TLS cada vez.
+        self._http = httpx.Client(
+            http2=True,
+            timeout=SUPABASE_PROBE_TIMEOUT,
+            headers={"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}"},
+        )
+        self.health = CircuitBreaker(self._probe, failure_threshold=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN)
         base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
         self.offline = OfflineStore(base_dir)
+        self.replica = LocalReplica(base_dir)
+        self.last_sync_error: str | None = None
+
+    def execute(self, query):
+        # Toda llamada a PostgREST pasa por aquí: si el backend se sabe caído
+        # se falla en milisegundos en vez de esperar el timeout de red.
+        if not self.health.allow():
+            raise BackendUnavailableError("Sin conexión con Supabase")
+        try:
+            res = query.execute()
+        except Exception as e:
+            if is_connection_error(e):
+                self.health.record_failure()
+            else:
+                self.health.record_success()
+            raise
+        self.health.record_success()
+        return res
+
+    def iter_rows(self, build_query: Callable, page_size: int | None = None) -> Iterator[dict]:
+        # PostgREST corta cada respuesta en max-rows sin avisar: se pide por
+        # páginas con .range() hasta recibir una incompleta. build_query arma
+        # un query nuevo por página y debe tener un orden total (p. ej.
+        # created_at, id) para que las páginas no se traslapen.
+        page_size = page_size or SUPABASE_PAGE_SIZE
+        start = 0
+        while True:
+            rows = self.execute(build_query().range(start, start + page_size - 1)).data or []
+            yield from rows
+            if len(rows) < page_size:
+                return
+            start += page_size
 
     def get_productos(self):
-        res = self.client.table("productos").select("*").eq("activo", True).order("categoria").execute()
+        res = self.execute(self.client.table("productos").select("*").eq("activo", True).order("categoria"))
         return res.data or []
 
     def listar_productos(self) -> list[dict]:
-        res = self.client.table("productos").select("*").order("categoria").execute()
+        res = self.execute(self.client.table("productos").select("*").order("categoria"))
         return res.data or []
 
     def crear_producto(self, nombre: str, categoria: str, precio: float, activo: bool = True) -> dict:
@@ -32,7 +102,7 @@ class SupabaseService:
             "precio": round(float(precio), 2),
             "activo": bool(activo),
         }
-        res = self.client.table("productos").insert(data).execute()
+        res = self.execute(self.client.table("productos").insert(data))
         return res.data[0]
 
     def actualizar_producto(
@@ -62,19 +132,12 @@ class SupabaseService:
             data["activo"] = bool(activo)
         if not data:
             raise ValueError("no hay cambios para actualizar")
-        res = self.client.table("productos").update(data).eq("id", producto_id).execute()
+        res = self.execute(self.client.table("productos").update(data).eq("id", producto_id))
         return res.data[0]
 
     def crear_comanda(self, mesero: str, metodo_pago: str, total: float, recibido: float | None, cambio: float | None):
-        data = {
-            "mesero": mesero,
-            "metodo_pago": metodo_pago,
-            "total": round(float(total), 2),
-            "recibido": None if recibido is None else round(float(recibido), 2),
-            "cambio": None if cambio is None else round(float(cambio), 2),
-            "status": "PAGADA",
-        }
-        res = self.client.table("comandas").insert(data).execute()
+        data = self._comanda_row(mesero, metodo_pago, total, recibido, cambio)
+        res = self.execute(self.client.table("comandas").insert(data))
         return res.data[0]
 
     def guardar_comanda(
@@ -87,44 +150,31 @@ class SupabaseService:
         items: list[dict],
         propina: float | None = None,
     ) -> dict:
+        # Los ids se generan aquí (UUIDv7) y viajan en el payload offline, así
+        # que reintentar o reenviar la comanda nunca duplica la venta.
+        con_propina = bool(propina and propina > 0)
         payload = {
+            "id": uuid7(),
             "mesero": mesero,
             "metodo_pago": metodo_pago,
             "total": total,
             "recibido": recibido,
             "cambio": cambio,
-            "items": items,
+            "items": [dict(it, uid=uuid7()) for it in items],
             "propina": propina,
+            "propina_id": uuid7() if con_propina else None,
         }
+        self._replica_apply(self.replica.apply_comanda, payload)
         try:
-            comanda = self.crear_comanda(mesero, metodo_pago, total, recibido, cambio)
-            self.agregar_items(comanda["id"], items)
-            if propina and propina > 0:
-                self.crear_propina(
-                    monto=propina,
-                    mesero_id=None,
-                    mesero_nombre_snapshot=mesero or "Sin nombre",
-                    fuente="COMANDA",
-                    comanda_id=comanda["id"],
-                )
-            return comanda
+            return self._upsert_comandas([payload])[0]
         except Exception:
             self.offline.enqueue("comanda", payload)
             return {"offline": True}
 
     def agregar_items(self, comanda_id: str, items: list[dict]):
         # items: {producto_id, nombre_snapshot, precio_unitario, cantidad, subtotal}
-        payload = []
-        for it in items:
-            payload.append({
-                "comanda_id": comanda_id,
-                "producto_id": it["producto_id"],
-                "nombre_snapshot": it["nombre_snapshot"],
-                "precio_unitario": round(float(it["precio_unitario"]), 2),
-                "cantidad": int(it["cantidad"]),
-                "subtotal": round(float(it["subtotal"]), 2),
-            })
-        self.client.table("comanda_items").insert(payload).execute()
+        payload = self._items_rows(comanda_id, items)
+        self.execute(self.client.table("comanda_items").insert(payload))
 
    # ---------------- Gastos ----------------
     def crear_gasto(self, concepto: str, categoria: str, monto: float, nota: str | None = None, metodo_pago: str = "EFECTIVO") -> dict:
@@ -138,14 +188,16 @@ class SupabaseService:
             raise ValueError("monto debe ser > 0")
 
         data = {
+            "id": uuid7(),
             "concepto": concepto.strip(),
             "categoria": categoria.strip(),
             "monto": round(float(monto), 2),
             "nota": nota.strip() if isinstance(nota, str) and nota.strip() else None,
             "metodo_pago": metodo_pago.strip() # faltaba el metodo de pago
         }
+        self._replica_apply(self.replica.apply_gasto, data)
         try:
-            res = self.client.table("gastos").insert(data).execute()
+            res = self.execute(self.client.table("gastos").insert(data))
             return res.data[0]
         except Exception:
             self.offline.enqueue("gasto", data)
@@ -153,21 +205,19 @@ class SupabaseService:
 
     # ---------------- Meseros ----------------
     def listar_meseros_activos(self) -> list[dict]:
-        res = (
+        res = self.execute(
             self.client.table("meseros")
             .select("id, nombre, activo")
             .eq("activo", True)
             .order("nombre")
-            .execute()
         )
         return res.data or []
 
     def listar_meseros(self) -> list[dict]:
-        res = (
+        res = self.execute(
             self.client.table("meseros")
             .select("id, nombre, activo")
             .order("nombre")
-            .execute()
         )
         return res.data or []
 
@@ -175,7 +225,7 @@ class SupabaseService:
         if not nombre or not nombre.strip():
             raise ValueError("nombre es obligatorio")
         data = {"nombre": nombre.strip(), "activo": True}
-        res = self.client.table("meseros").insert(data).execute()
+        res = self.execute(self.client.table("meseros").insert(data))
         return res.data[0]
 
     def actualizar_mesero(self, mesero_id: str, nombre: str | None = None, activo: bool | None = None) -> dict:
@@ -190,21 +240,21 @@ class SupabaseService:
             data["activo"] = bool(activo)
         if not data:
             raise ValueError("no hay cambios para actualizar")
-        res = self.client.table("meseros").update(data).eq("id", mesero_id).execute()
+        res = self.execute(self.client.table("meseros").update(data).eq("id", mesero_id))
         return res.data[0]
 
     def listar_gastos_dia(self, fecha: date) -> list[dict]:
         # Criterio: rango completo del día en UTC (00:00:00 -> 23:59:59.999999)
         desde, hasta = self._day_range(fecha)
-        res = (
-            self.client.table("gastos")
+        res = self.iter_rows(
+            lambda: self.client.table("gastos")
             .select("*")
             .gte("created_at", desde)
             .lte("created_at", hasta)
             .order("created_at")
-            .execute()
+            .order("id")
         )
-        return res.data or []
+        return list(res)
 
     # ---------------- Propinas ----------------
     def crear_propina(
@@ -223,14 +273,16 @@ class SupabaseService:
             fuente = "MANUAL"
 
         data = {
+            "id": uuid7(),
             "monto": round(float(monto), 2),
             "mesero_id": mesero_id,
             "mesero_nombre_snapshot": mesero_nombre_snapshot.strip() if mesero_nombre_snapshot else None,
             "fuente": fuente.strip(),
             "comanda_id": comanda_id,
         }
+        self._replica_apply(self.replica.apply_propina, data)
         try:
-            res = self.client.table("propinas").insert(data).execute()
+            res = self.execute(self.client.table("propinas").insert(data))
             return res.data[0]
         except Exception:
             self.offline.enqueue("propina", data)
@@ -242,15 +294,15 @@ class SupabaseService:
         if hasta < desde:
             raise ValueError("hasta debe ser >= desde")
 
-        res = (
-            self.client.table("propinas")
+        res = self.iter_rows(
+            lambda: self.client.table("propinas")
             .select("*")
             .gte("fecha", desde.isoformat())
             .lte("fecha", hasta.isoformat())
             .order("fecha")
-            .execute()
+            .order("id")
         )
-        return res.data or []
+        return list(res)
 
     def reporte_propinas_mes(self, year: int, month: int) -> list[dict]:
         if month < 1 or month > 12:
@@ -275,18 +327,21 @@ class SupabaseService:
             label = mesero_name or mesero_id or "Sin nombre"
 
             if key not in agg:
-                agg[key] = {"mesero": label, "total_propinas": 0.0, "num_propinas": 0}
+                agg[key] = {"mesero": label, "total_propinas": 0, "num_propinas": 0}
 
-            agg[key]["total_propinas"] += float(r.get("monto") or 0)
+            # Centavos mientras se acumula; a pesos al final
+            agg[key]["total_propinas"] += to_cents(r.get("monto"))
             agg[key]["num_propinas"] += 1
 
         result = list(agg.values())
+        for item in result:
+            item["total_propinas"] = to_pesos(item["total_propinas"])
         result.sort(key=lambda x: (-x["total_propinas"], x["mesero"]))
         return result
 
     # ---------------- Cierre de caja ----------------
     def obtener_cierre(self, fecha: date) -> dict | None:
-        res = self.client.table("cierres_caja").select("*").eq("fecha", fecha.isoformat()).execute()
+        res = self.execute(self.client.table("cierres_caja").select("*").eq("fecha", fecha.isoformat()))
         if not res.data:
             return None
         return res.data[0]
@@ -301,88 +356,229 @@ class SupabaseService:
 
         desde, hasta = self._day_range(fecha)
 
-        ventas_rows = (
-            self.client.table("comandas")
+        ventas_rows = self.iter_rows(
+            lambda: self.client.table("comandas")
             .select("total, metodo_pago")
             .gte("created_at", desde)
             .lte("created_at", hasta)
-            .execute()
-        ).data or []
-
-        total_ventas = sum(float(r.get("total") or 0) for r in ventas_rows)
-        ventas_efectivo = sum(
-            float(r.get("total") or 0)
-            for r in ventas_rows
-            if r.get("metodo_pago") == "EFECTIVO"
+            .order("created_at")
+            .order("id")
         )
 
-        gastos_rows = (
-            self.client.table("gastos")
+        # Una sola pasada: ventas_rows es un generador paginado. Todo en
+        # centavos para que diferencia_efectivo no arrastre error de float.
+        total_ventas = 0
+        ventas_efectivo = 0
+        for r in ventas_rows:
+            total = to_cents(r.get("total"))
+            total_ventas += total
+            if r.get("metodo_pago") == "EFECTIVO":
+                ventas_efectivo += total
+
+        gastos_rows = self.iter_rows(
+            lambda: self.client.table("gastos")
             .select("monto")
             .gte("created_at", desde)
             .lte("created_at", hasta)
-            .execute()
-        ).data or []
+            .order("created_at")
+            .order("id")
+        )
 
-        total_gastos = sum(float(r.get("monto") or 0) for r in gastos_rows)
-        neto = total_ventas - total_gastos
-        diferencia_efectivo = float(efectivo_reportado) - ventas_efectivo
+        total_gastos = sum(to_cents(r.get("monto")) for r in gastos_rows)
+        reportado = to_cents(efectivo_reportado)
 
         data = {
+            "id": uuid7(),
             "fecha": fecha.isoformat(),
-            "total_ventas": round(float(total_ventas), 2),
-            "total_gastos": round(float(total_gastos), 2),
-            "neto": round(float(neto), 2),
-            "efectivo_reportado": round(float(efectivo_reportado), 2),
-            "diferencia_efectivo": round(float(diferencia_efectivo), 2),
+            "total_ventas": to_pesos(total_ventas),
+            "total_gastos": to_pesos(total_gastos),
+            "neto": to_pesos(total_ventas - total_gastos),
+            "efectivo_reportado": to_pesos(reportado),
+            "diferencia_efectivo": to_pesos(reportado - ventas_efectivo),
             "notas": notas.strip() if isinstance(notas, str) and notas.strip() else None,
         }
         try:
-            res = self.client.table("cierres_caja").insert(data).execute()
+            res = self.execute(self.client.table("cierres_caja").insert(data))
             return res.data[0]
         except Exception:
             self.offline.enqueue("cierre", data)
             return {"offline": True}
 
-    def sync_offline(self) -> int:
-        ops = self.offline.list_ops()
+    def sync_offline(self, batch_size: int | None = None) -> int:
+        # Recorre la cola por páginas (sin cargarla entera); cada página se
+        # agrupa por tabla, se manda con una llamada por tabla y lo
+        # sincronizado se borra en una transacción.
+        batch_size = batch_size or SYNC_BATCH_SIZE
+        self.last_sync_error = None
+        if not self.health.allow():
+            self.last_sync_error = "Sin conexión con Supabase"
+            return 0
         synced = 0
+        for chunk in self.offline.iter_batches(batch_size):
+            grupos: dict[str, list[dict]] = {}
+            for op in chunk:
+                if self._ensure_ids(op):
+                    self.offline.update_payload(op["id"], op["payload"])
+                grupos.setdefault(op["op"], []).append(op)
+
+            done: list[int] = []
+            completo = True
+            for tipo in OFFLINE_ORDER:
+                pendientes = grupos.get(tipo)
+                if pendientes:
+                    ids, completo = self._sync_grupo(tipo, pendientes)
+                    done.extend(ids)
+                    if not completo:
+                        break
+            self.offline.delete_ops(done)
+            synced += len(done)
+            # Un error transitorio corta todo el ciclo: lo que sigue en
+            # OFFLINE_ORDER (p. ej. un cierre) no puede llegar antes que las
+            # comandas que quedaron en la cola.
+            if not completo:
+                break
+        return synced
+
+    def _sync_grupo(self, tipo: str, ops: list[dict]) -> tuple[list[int], bool]:
+        # Regresa (ids sincronizados o ya en dead letter, si se puede seguir)
+        try:
+            self._upsert_ops(tipo, ops)
+            return [op["id"] for op in ops], True
+        except Exception as e:
+            if not is_permanent_error(e):
+                # Red o backend caído: todo el bloque espera al siguiente ciclo
+                self.last_sync_error = str(e)
+                return [], False
+        # Algo del bloque es inválido: se manda uno por uno para aislarlo; lo
+        # que falla de forma definitiva va a dead_letter_ops y el resto sigue.
+        done = []
         for op in ops:
             try:
-                if op["op"] == "gasto":
-                    self.client.table("gastos").insert(op["payload"]).execute()
-                elif op["op"] == "propina":
-                    self.client.table("propinas").insert(op["payload"]).execute()
-                elif op["op"] == "cierre":
-                    self.client.table("cierres_caja").insert(op["payload"]).execute()
-                elif op["op"] == "comanda":
-                    p = op["payload"]
-                    comanda = self.crear_comanda(
-                        p["mesero"],
-                        p["metodo_pago"],
-                        p["total"],
-                        p.get("recibido"),
-                        p.get("cambio"),
-                    )
-                    self.agregar_items(comanda["id"], p.get("items") or [])
-                    if p.get("propina"):
-                        self.crear_propina(
-                            monto=float(p.get("propina") or 0),
-                            mesero_id=None,
-                            mesero_nombre_snapshot=p.get("mesero") or "Sin nombre",
-                            fuente="COMANDA",
-                            comanda_id=comanda["id"],
-                        )
-                else:
-                    continue
-                self.offline.delete_op(op["id"])
-                synced += 1
-            except Exception:
-                # Si falla, no borres y sigue
-                continue
-        return synced
+                self._upsert_ops(tipo, [op])
+                done.append(op["id"])
+            except Exception as e:
+                self.last_sync_error = str(e)
+                if not is_permanent_error(e):
+                    # Lo demás del grupo y de la cola espera al siguiente ciclo
+                    return done, False
+                self.offline.move_to_dead_letter(op["id"], f"{type(e).__name__}: {e}")
+                self._replica_discard(tipo, op["payload"])
+        return done, True
+
+    def _upsert_ops(self, tipo: str, ops: list[dict]) -> None:
+        # Upsert por id: si el bloque ya había llegado antes, reenviarlo no duplica
+        if tipo in OFFLINE_TABLES:
+            self.execute(self.client.table(OFFLINE_TABLES[tipo]).upsert([op["payload"] for op in ops], on_conflict="id"))
+            return
+        if tipo != "comanda":
+            raise ValueError(f"operación offline desconocida: {tipo}")
+        self._upsert_comandas([op["payload"] for op in ops])
+
+    def _upsert_comandas(self, payloads: list[dict]) -> list[dict]:
+        # Encabezado, items y propina viajan juntos a una función SQL
+        # (sql/registrar_comanda.sql): un round trip y una transacción.
+        rows = [self._comanda_rpc_row(p) for p in payloads]
+        if len(rows) == 1:
+            res = self.execute(self.client.rpc("registrar_comanda", {"p_comanda": rows[0]}))
+        else:
+            res = self.execute(self.client.rpc("registrar_comandas", {"p_comandas": rows}))
+        return res.data or []
+
+    def _comanda_rpc_row(self, p: dict) -> dict:
+        data = self._comanda_row(p["mesero"], p["metodo_pago"], p["total"], p.get("recibido"), p.get("cambio"))
+        data["id"] = p["id"]
+        data["items"] = self._items_rows(p["id"], p.get("items") or [])
+        data["propina"] = None
+        if p.get("propina"):
+            data["propina"] = {
+                "id": p["propina_id"],
+                "monto": round(float(p.get("propina") or 0), 2),
+                "mesero_nombre_snapshot": p.get("mesero") or "Sin nombre",
+            }
+        return data
+
+    def _ensure_ids(self, op: dict) -> bool:
+        # Ops encoladas antes de los ids de cliente: se les asigna uno y se
+        # guarda en la cola antes de mandarlas, para que el reintento lo reuse.
+        p = op["payload"]
+        changed = False
+        if not p.get("id"):
+            p["id"] = uuid7()
+            changed = True
+        if op["op"] == "comanda":
+            for it in p.get("items") or []:
+                if not it.get("uid"):
+                    it["uid"] = uuid7()
+                    changed = True
+            if p.get("propina") and not p.get("propina_id"):
+                p["propina_id"] = uuid7()
+                changed = True
+        return changed
 
     # ---------------- Helpers ----------------
+    def _probe(self) -> bool:
+        # Petición mínima con timeout corto; cualquier respuesta < 500 indica enlace vivo
+        try:
+            r = self._http.get(f"{SUPABASE_URL}/rest/v1/productos", params={"select": "id", "limit": "1"})
+        except httpx.HTTPError:
+            return False
+        return r.status_code < 500
+
+    def _comanda_row(self, mesero: str, metodo_pago: str, total: float, recibido: float | None, cambio: float | None) -> dict:
+        return {
+            "mesero": mesero,
+            "metodo_pago": metodo_pago,
+            "total": round(float(total), 2),
+            "recibido": None if recibido is None else round(float(recibido), 2),
+            "cambio": None if cambio is None else round(float(cambio), 2),
+            "status": "PAGADA",
+        }
+
+    def _items_rows(self, comanda_id: str, items: list[dict]) -> list[dict]:
+        rows = []
+        for it in items:
+            rows.append({
+                "comanda_id": comanda_id,
+                "producto_id": it["producto_id"],
+                "nombre_snapshot": it["nombre_snapshot"],
+                "precio_unitario": round(float(it["precio_unitario"]), 2),
+                "cantidad": int(it["cantidad"]),
+                "subtotal": round(float(it["subtotal"]), 2),
+            })
+            if it.get("uid"):
+                rows[-1]["uid"] = it["uid"]
+        return rows
+
+    def _replica_apply(self, apply, data: dict) -> None:
+        # Los rollups locales se actualizan al guardar, con o sin red; si la
+        # réplica falla la venta sigue su curso y el pull la repone. Los
+        # reportes en caché que incluyen hoy dejan de valer.
+        try:
+            apply(data)
+        except Exception:
+            pass
+        report_cache.invalidate(today_utc())
+        self.forget_dias_tocados()
+
+    def _replica_discard(self, tipo: str, payload: dict) -> None:
+        # La op se aplicó a la réplica al guardarse y el server no la va a
+        # aceptar: se quita para que los reportes locales no la cuenten.
+        try:
+            self.replica.discard(tipo, payload)
+        except Exception:
+            return
+        self.forget_dias_tocados()
+
+    def forget_dias_tocados(self) -> None:
+        # Los días que cambiaron en la réplica salen de la caché de reportes,
+        # también las entradas inmutables y las de disco.
+        try:
+            dias = self.replica.take_dias_tocados()
+        except Exception:
+            return
+        for dia in dias:
+            report_cache.forget(date.fromisoformat(dia))
+
     def _day_range(self, fecha: date) -> tuple[str, str]:
         # Rango en UTC para created_at: 00:00:00 -> 23:59:59.999999
         start = datetime.combine(fecha, time.min, tzinfo=timezone.utc)
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import random
+
+
+class SyncScheduler:
+    """Decide cuánto esperar entre ciclos de sync.
+
+    - Cola vacía: espera `max_interval`; un enqueue o el regreso de la red
+      despiertan al hilo antes (ver SyncWorker.wake).
+    - Quedan pendientes y el ciclo salió bien: vuelve en `min_interval`.
+    - El ciclo falló (sin red, 5xx): backoff exponencial desde `min_interval`
+      hasta `max_interval`, con jitter para no sincronizar reintentos.
+    """
+
+    def __init__(self, min_interval: float = 5.0, max_interval: float = 300.0, jitter: float = 0.2):
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError("se requiere 0 < min_interval <= max_interval")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.failures = 0
+
+    def next_delay(self, pending: int, ok: bool) -> float:
+        if not ok:
+            self.failures += 1
+            delay = min(self.max_interval, self.min_interval * (2 ** (self.failures - 1)))
+            return min(self.max_interval, delay * random.uniform(1 - self.jitter, 1 + self.jitter))
+        self.failures = 0
+        if pending > 0:
+            return self.min_interval
+        return self.max_interval
+
+    def reset(self) -> None:
+        self.failures = 0
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from datetime import datetime
+
+from .registry import get_service
+from .report_cache import report_cache
+from .settings import REPLICA_PULL_INTERVAL, SYNC_MAX_INTERVAL, SYNC_MIN_INTERVAL
+from .supabase_service import SupabaseService
+from .sync_scheduler import SyncScheduler
+
+# Cada cuánto (segundos) se revisa la retención de respaldos
+_PRUNE_EVERY = 3600.0
+
+
+class SyncWorker(threading.Thread):
+    """Hilo que reenvía la cola offline sin bloquear el loop de Tk.
+
+    Usa el SupabaseService compartido del proceso (mismo pool HTTP y mismo
+    circuit breaker que la UI; SQLite abre una conexión por hilo) y sólo se
+    comunica con la UI publicando dicts de estado en `status`, una
+    queue.Queue que la UI vacía desde `after()`. El intervalo entre ciclos lo
+    decide SyncScheduler; `wake()` adelanta el siguiente ciclo. También
+    mantiene al día la réplica local de reportes cada REPLICA_PULL_INTERVAL.
+    """
+
+    def __init__(self, scheduler: SyncScheduler | None = None):
+        super().__init__(name="sync-offline", daemon=True)
+        self.scheduler = scheduler or SyncScheduler(SYNC_MIN_INTERVAL, SYNC_MAX_INTERVAL)
+        self.status: queue.Queue[dict] = queue.Queue()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._last_success: datetime | None = None
+        self._last_error: str | None = None
+        self._last_prune = 0.0
+        self._last_pull = 0.0
+        # Métricas: desde cuándo hay cola y cuánto tardó el último vaciado
+        self._backlog_since: float | None = None
+        self._last_drain_seconds: float | None = None
+
+    def run(self) -> None:
+        try:
+            db = get_service()
+        except Exception as e:
+            self._last_error = str(e)
+            self.status.put(self._snapshot(None, None, None, None))
+            return
+
+        while not self._stop_event.is_set():
+            delay = self._run_once(db)
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    def wake(self) -> None:
+        # Fuerza un ciclo inmediato: op nueva en la cola o regresó la red
+        self.scheduler.reset()
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._wake.set()
+
+    def _run_once(self, db: SupabaseService) -> float:
+        ok = True
+        try:
+            if db.offline.count_ops():
+                if db.sync_offline():
+                    # Lo que estaba en cola ya cuenta en los reportes de Supabase
+                    report_cache.invalidate()
+                ok = not db.last_sync_error
+            if ok and time.monotonic() - self._last_pull >= REPLICA_PULL_INTERVAL:
+                self._pull_replica(db)
+            if time.monotonic() - self._last_prune > _PRUNE_EVERY:
+                db.offline.prune_backups()
+                self._last_prune = time.monotonic()
+            if ok:
+                self._last_success = datetime.now()
+                self._last_error = None
+            else:
+                self._last_error = db.last_sync_error
+        except Exception as e:
+            ok = False
+            self._last_error = str(e)
+
+        try:
+            pending = db.offline.count_ops()
+            dead = db.offline.count_dead_letter()
+            oldest = db.offline.oldest_created_at()
+        except Exception:
+            pending = dead = oldest = None
+
+        delay = self.scheduler.next_delay(pending or 0, ok)
+        if ok:
+            # En reposo el scheduler duerme hasta SYNC_MAX_INTERVAL; la réplica
+            # no debe quedarse más atrás que REPLICA_PULL_INTERVAL.
+            delay = max(1.0, min(delay, self._last_pull + REPLICA_PULL_INTERVAL - time.monotonic()))
+        self.status.put(self._snapshot(pending, dead, oldest, delay))
+        return delay
+
+    def _pull_replica(self, db: SupabaseService) -> None:
+        # Un pull fallido no es error de sync: la cola sigue su curso y la
+        # réplica se pone al día en el siguiente intento.
+        try:
+            if db.replica.pull(db):
+                # Llegaron filas de otras cajas o del server: lo abierto se recalcula
+                report_cache.invalidate()
+            # y lo cerrado de los días que el pull cambió, también en disco
+            db.forget_dias_tocados()
+            db.replica.extend_prefix()
+        except Exception:
+            pass
+        self._last_pull = time.monotonic()
+
+    def _snapshot(self, pending: int | None, dead: int | None, oldest: datetime | None, delay: float | None) -> dict:
+        now = time.monotonic()
+        if pending and self._backlog_since is None:
+            self._backlog_since = now
+        elif pending == 0 and self._backlog_since is not None:
+            self._last_drain_seconds = now - self._backlog_since
+            self._backlog_since = None
+        return {
+            "pending": pending,
+            "dead_letter": dead,
+            "last_success": self._last_success,
+            "last_error": self._last_error,
+            # Antigüedad de la op más vieja sin sincronizar
+            "lag_seconds": (datetime.now() - oldest).total_seconds() if oldest else 0.0,
+            "drain_seconds": self._last_drain_seconds,
+            "next_sync_seconds": delay,
+        }
@@ -5,6 +5,7 @@ import tkinter as tk
 from tkinter import messagebox
 import customtkinter as ctk
 
+from services.registry import get_service
 from services.supabase_service import SupabaseService
 from services.reportes import resumen_ventas_por_metodo
 
@@ -201,6 +202,6 @@ if __name__ == "__main__":
     ctk.set_appearance_mode("light")
     root = ctk.CTk()
     root.withdraw()
-    db = SupabaseService()
+    db = get_service()
     dlg = CierreDialog(root, db)
     dlg.mainloop()
@@ -1,19 +1,16 @@
 from __future__ import annotations
 
 from datetime import date
+import queue
+import threading
 import tkinter as tk
 from tkinter import messagebox
 import customtkinter as ctk
 
 from domain.corte import calc_diferencia, calc_efectivo_teorico
+from domain.money import to_cents, to_pesos
 from ui.assets import load_logo
-from services.corte_service import (
-    get_corte_por_fecha,
-    get_gastos_total,
-    get_propinas_total,
-    get_ventas_por_metodo,
-    save_corte,
-)
+from services.corte_service import get_corte_inputs, save_corte
 from services.supabase_service import SupabaseService
 
 
@@ -27,6 +24,11 @@ class CorteView(ctk.CTkToplevel):
 
         self.db = supabase
         self._last = {}
+        # Carga en segundo plano: el hilo deja (seq, fecha, resultado) en la
+        # cola y la UI la revisa con after(); sólo cuenta la carga más reciente.
+        self._load_queue: queue.Queue = queue.Queue()
+        self._load_seq = 0
+        self._poll_id = None
 
         self.fecha_var = tk.StringVar(value=date.today().isoformat())
         self.efectivo_contado_var = tk.StringVar()
@@ -118,58 +120,86 @@ class CorteView(ctk.CTkToplevel):
         if not fecha:
             return
 
-        self.status_var.set("Cargando datos...")
-        self.update_idletasks()
+        self.status_var.set("Cargando...")
+        self._last = {}
+        self._load_seq += 1
+        threading.Thread(target=self._load_inputs, args=(self._load_seq, fecha), daemon=True).start()
+        if self._poll_id is None:
+            self._poll_id = self.after(100, self._poll_inputs)
 
+    def _load_inputs(self, seq: int, fecha: date):
+        # Corre fuera del hilo de Tk: no toca widgets
         try:
-            ventas = get_ventas_por_metodo(fecha, db=self.db)
-            gastos_total = get_gastos_total(fecha, db=self.db)
-            propinas_total = get_propinas_total(fecha, db=self.db)
+            result = get_corte_inputs(fecha, db=self.db)
         except Exception as e:
+            result = e
+        self._load_queue.put((seq, fecha, result))
+
+    def _poll_inputs(self):
+        self._poll_id = None
+        try:
+            while True:
+                seq, fecha, result = self._load_queue.get_nowait()
+                if seq == self._load_seq:
+                    self._render_inputs(fecha, result)
+                    return
+        except queue.Empty:
+            pass
+        self._poll_id = self.after(100, self._poll_inputs)
+
+    def _render_inputs(self, fecha: date, result):
+        if isinstance(result, Exception):
             self.status_var.set("")
-            messagebox.showerror("Error", f"No se pudo cargar el resumen:\n{e}")
+            messagebox.showerror("Error", f"No se pudo cargar el resumen:\n{result}")
             return
 
-        total_ventas = float(ventas.get("total") or 0)
-        neto = total_ventas - gastos_total
+        ventas = result["ventas"]
+        gastos_total = result["gastos_total"]
+        propinas_total = result["propinas_total"]
+
+        # Las cuentas en centavos; a pesos sólo para mostrar y guardar
+        total_ventas_c = to_cents(ventas.get("total"))
+        gastos_c = to_cents(gastos_total)
+        neto_c = total_ventas_c - gastos_c
         efectivo_teorico = calc_efectivo_teorico(
-            ventas_efectivo=float(ventas.get("EFECTIVO") or 0),
+            ventas_efectivo=ventas.get("EFECTIVO") or 0,
             gastos_total=gastos_total,
             propinas_total=propinas_total,
         )
 
         self._last = {
             "fecha": fecha.isoformat(),
-            "total_ventas": total_ventas,
-            "total_gastos": gastos_total,
-            "neto": neto,
+            "total_ventas": to_pesos(total_ventas_c),
+            "total_gastos": to_pesos(gastos_c),
+            "neto": to_pesos(neto_c),
             "efectivo_teorico": efectivo_teorico,
         }
 
-        self.total_ventas_var.set(f"${total_ventas:.2f}")
-        self.ventas_efectivo_var.set(f"${float(ventas.get('EFECTIVO') or 0):.2f}")
-        self.ventas_tarjeta_var.set(f"${float(ventas.get('TARJETA') or 0):.2f}")
-        self.ventas_transfer_var.set(f"${float(ventas.get('TRANSFER') or 0):.2f}")
-        self.total_gastos_var.set(f"${gastos_total:.2f}")
-        self.total_propinas_var.set(f"${propinas_total:.2f}")
+        self.total_ventas_var.set(f"${to_pesos(total_ventas_c):.2f}")
+        self.ventas_efectivo_var.set(f"${to_pesos(to_cents(ventas.get('EFECTIVO'))):.2f}")
+        self.ventas_tarjeta_var.set(f"${to_pesos(to_cents(ventas.get('TARJETA'))):.2f}")
+        self.ventas_transfer_var.set(f"${to_pesos(to_cents(ventas.get('TRANSFER'))):.2f}")
+        self.total_gastos_var.set(f"${to_pesos(gastos_c):.2f}")
+        self.total_propinas_var.set(f"${to_pesos(to_cents(propinas_total)):.2f}")
         self.efectivo_teorico_var.set(f"${efectivo_teorico:.2f}")
-        self.neto_var.set(f"${neto:.2f}")
+        self.neto_var.set(f"${to_pesos(neto_c):.2f}")
 
-        self._load_corte_existente(fecha)
+        self._show_corte_existente(fecha, result["corte"])
         self._update_diferencia()
 
-    def _load_corte_existente(self, fecha: date):
-        try:
-            corte = get_corte_por_fecha(fecha, db=self.db)
-        except Exception:
-            corte = None
-
+    def _show_corte_existente(self, fecha: date, corte: dict | None):
         if corte:
             self.status_var.set(f"Corte existente para {fecha.isoformat()}.")
             self.efectivo_contado_var.set(f"{float(corte.get('efectivo_reportado') or 0):.2f}")
         else:
             self.status_var.set("No hay corte registrado para este día.")
 
+    def destroy(self):
+        if self._poll_id is not None:
+            self.after_cancel(self._poll_id)
+            self._poll_id = None
+        super().destroy()
+
     def _update_diferencia(self):
         try:
             efectivo_contado = float(self.efectivo_contado_var.get().strip() or 0)
@@ -183,9 +213,10 @@ class CorteView(ctk.CTkToplevel):
 
     def _guardar_corte(self):
         if not self._last:
+            # Aún cargando o la carga falló: se (re)carga y se guarda después
+            messagebox.showinfo("Corte", "Espera a que cargue el resumen del día y vuelve a guardar.")
             self._refresh()
-            if not self._last:
-                return
+            return
 
         try:
             efectivo_contado = float(self.efectivo_contado_var.get().strip())
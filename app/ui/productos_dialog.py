@@ -4,6 +4,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import customtkinter as ctk
 
+from services.registry import get_service
 from services.supabase_service import SupabaseService
 from ui.assets import load_logo
 
@@ -139,6 +140,6 @@ if __name__ == "__main__":
     ctk.set_appearance_mode("light")
     root = ctk.CTk()
     root.withdraw()
-    db = SupabaseService()
+    db = get_service()
     dlg = ProductosDialog(root, db)
     dlg.mainloop()
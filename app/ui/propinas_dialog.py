@@ -5,6 +5,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import customtkinter as ctk
 
+from services.registry import get_service
 from services.supabase_service import SupabaseService
 from ui.assets import load_logo
 
@@ -112,12 +113,11 @@ class PropinasDialog(ctk.CTkToplevel):
 
     def _load_meseros(self):
         try:
-            res = (
+            res = self.db.execute(
                 self.db.client.table("meseros")
                 .select("id, nombre")
                 .eq("activo", True)
                 .order("nombre")
-                .execute()
             )
             data = res.data or []
         except Exception:
@@ -198,6 +198,6 @@ if __name__ == "__main__":
     ctk.set_appearance_mode("light")
     root = ctk.CTk()
     root.withdraw()
-    db = SupabaseService()
+    db = get_service()
     dlg = PropinasDialog(root, db)
     dlg.mainloop()
@@ -2,17 +2,16 @@ from __future__ import annotations
 
 from datetime import date, timedelta, datetime
 import csv
+import os
+import queue
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox
 import customtkinter as ctk
 
 from ui.assets import load_logo
-from services.reportes_service import (
-    get_top_productos,
-    get_ventas_por_dia,
-    get_ventas_por_metodo,
-    get_ventas_por_mesero,
-)
+from services.exportador import exportar_detalle
+from services.reportes_service import get_reporte_ventas
 from services.supabase_service import SupabaseService
 from ui.reportes_graficas import ReportesGraficas
 
@@ -40,6 +39,13 @@ class ReportesView(ctk.CTkToplevel):
         self.ventas_tarjeta_var = tk.StringVar(value="0.00")
         self.ventas_transfer_var = tk.StringVar(value="0.00")
         self.ventas_total_var = tk.StringVar(value="0.00")
+        self.comprimir_var = tk.BooleanVar(value=False)
+
+        # Exportación de detalle en segundo plano: el hilo publica avances
+        # en la cola y la UI la revisa con after()
+        self._export_queue: queue.Queue = queue.Queue()
+        self._export_thread: threading.Thread | None = None
+        self._export_poll_id = None
 
         self._build_ui()
         self._load_reportes()
@@ -116,6 +122,8 @@ class ReportesView(ctk.CTkToplevel):
         actions = ctk.CTkFrame(self, fg_color="transparent")
         actions.pack(fill="x", padx=12, pady=(0, 12))
         ctk.CTkButton(actions, text="Exportar CSV", command=self._export_csv).pack(side="left", padx=6)
+        ctk.CTkButton(actions, text="Exportar detalle", command=self._export_detalle).pack(side="left", padx=6)
+        ctk.CTkCheckBox(actions, text="Comprimir (.gz)", variable=self.comprimir_var).pack(side="left", padx=6)
 
     def _parse_fecha(self, value: str) -> date | None:
         try:
@@ -137,15 +145,16 @@ class ReportesView(ctk.CTkToplevel):
         self.update_idletasks()
 
         try:
-            self._top_productos = get_top_productos(inicio, fin, limit=10, db=self.db)
-            self._ventas_por_dia = get_ventas_por_dia(inicio, fin, db=self.db)
-            self._ventas_por_metodo = get_ventas_por_metodo(inicio, fin, db=self.db)
-            self._ventas_por_mesero = get_ventas_por_mesero(inicio, fin, limit=8, db=self.db)
+            reporte = get_reporte_ventas(inicio, fin, top_limit=10, mesero_limit=8, db=self.db)
         except Exception as e:
             self.status_var.set("")
             messagebox.showerror("Error", f"No se pudieron cargar los reportes:\n{e}")
             return
 
+        self._top_productos = reporte["top_productos"]
+        self._ventas_por_dia = reporte["ventas_por_dia"]
+        self._ventas_por_metodo = reporte["ventas_por_metodo"]
+        self._ventas_por_mesero = reporte["ventas_por_mesero"]
         self._render_tablas()
         self.status_var.set("Reportes listos.")
 
@@ -209,6 +218,64 @@ class ReportesView(ctk.CTkToplevel):
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo exportar CSV:\n{e}")
 
+    def _export_detalle(self):
+        if self._export_thread is not None and self._export_thread.is_alive():
+            messagebox.showinfo("Exportando", "Ya hay una exportación en curso.")
+            return
+        inicio = self._parse_fecha(self.fecha_inicio_var.get())
+        fin = self._parse_fecha(self.fecha_fin_var.get())
+        if not inicio or not fin:
+            messagebox.showwarning("Fechas inválidas", "Usa el formato YYYY-MM-DD.")
+            return
+        if fin < inicio:
+            messagebox.showwarning("Rango inválido", "La fecha fin debe ser >= fecha inicio.")
+            return
+
+        self.status_var.set("Exportando detalle...")
+        self._export_thread = threading.Thread(
+            target=self._run_export,
+            args=(inicio, fin, bool(self.comprimir_var.get())),
+            daemon=True,
+        )
+        self._export_thread.start()
+        self._export_poll_id = self.after(200, self._poll_export)
+
+    def _run_export(self, inicio: date, fin: date, comprimir: bool):
+        # Corre fuera del hilo de Tk: sólo habla con la UI por la cola
+        def progress(tabla: str, filas: int):
+            self._export_queue.put(("progress", f"Exportando {tabla}: {filas} filas..."))
+
+        try:
+            paths = exportar_detalle(inicio, fin, "exports", db=self.db, comprimir=comprimir, progress=progress)
+            self._export_queue.put(("done", paths))
+        except Exception as e:
+            self._export_queue.put(("error", e))
+
+    def _poll_export(self):
+        self._export_poll_id = None
+        try:
+            while True:
+                kind, value = self._export_queue.get_nowait()
+                if kind == "progress":
+                    self.status_var.set(value)
+                elif kind == "done":
+                    self.status_var.set("Detalle exportado.")
+                    messagebox.showinfo("OK", "CSV de detalle exportado en:\n" + "\n".join(value))
+                    return
+                else:
+                    self.status_var.set("")
+                    messagebox.showerror("Error", f"No se pudo exportar el detalle:\n{value}")
+                    return
+        except queue.Empty:
+            pass
+        self._export_poll_id = self.after(200, self._poll_export)
+
+    def destroy(self):
+        if self._export_poll_id is not None:
+            self.after_cancel(self._export_poll_id)
+            self._export_poll_id = None
+        super().destroy()
+
     def _open_graficas(self):
         inicio = self._parse_fecha(self.fecha_inicio_var.get())
         fin = self._parse_fecha(self.fecha_fin_var.get())
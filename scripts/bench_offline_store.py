@@ -0,0 +1,104 @@
+"""Micro-benchmark de la cola offline: encolar y vaciar N operaciones.
+
+Compara el esquema anterior (una conexión y un commit en modo rollback-journal
+por llamada) contra OfflineStore (conexión persistente en WAL, borrado por
+bloques). Usa directorios temporales; no toca app/data.
+
+    python scripts/bench_offline_store.py --ops 2000 --batch 50
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "app")))
+
+from services.offline_store import OfflineStore  # noqa: E402
+
+
+PAYLOAD = {
+    "mesero": "Bench",
+    "metodo_pago": "EFECTIVO",
+    "total": 250.0,
+    "recibido": 300.0,
+    "cambio": 50.0,
+    "items": [
+        {"producto_id": 1, "nombre_snapshot": "Taco de barbacoa", "precio_unitario": 35.0, "cantidad": 4, "subtotal": 140.0},
+        {"producto_id": 2, "nombre_snapshot": "Consomé", "precio_unitario": 55.0, "cantidad": 2, "subtotal": 110.0},
+    ],
+    "propina": 20.0,
+}
+
+
+class LegacyStore:
+    # Réplica del OfflineStore previo: connect + commit por cada llamada
+    def __init__(self, base_dir: str):
+        self.db_path = os.path.join(base_dir, "offline.db")
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS offline_ops ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT NOT NULL, payload TEXT NOT NULL, created_at TEXT NOT NULL)"
+            )
+            conn.commit()
+
+    def enqueue(self, op: str, payload: dict) -> None:
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO offline_ops (op, payload, created_at) VALUES (?, ?, ?)",
+                (op, json.dumps(payload, ensure_ascii=False), datetime.now().isoformat(timespec="seconds")),
+            )
+            conn.commit()
+
+    def list_ops(self, limit: int | None = None) -> list[dict]:
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute("SELECT id, op, payload, created_at FROM offline_ops ORDER BY id").fetchall()
+        rows = rows[:limit] if limit else rows
+        return [{"id": r[0], "op": r[1], "payload": json.loads(r[2]), "created_at": r[3]} for r in rows]
+
+    def delete_ops(self, op_ids: list[int]) -> None:
+        for op_id in op_ids:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("DELETE FROM offline_ops WHERE id = ?", (op_id,))
+                conn.commit()
+
+
+def _run(store, n_ops: int, batch: int) -> tuple[float, float]:
+    t0 = time.perf_counter()
+    for _ in range(n_ops):
+        store.enqueue("comanda", PAYLOAD)
+    enqueue_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    while True:
+        ops = store.list_ops(limit=batch)
+        if not ops:
+            break
+        store.delete_ops([op["id"] for op in ops])
+    drain_s = time.perf_counter() - t0
+    return n_ops / enqueue_s, n_ops / drain_s
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as legacy_dir, tempfile.TemporaryDirectory() as wal_dir:
+        legacy = _run(LegacyStore(legacy_dir), args.ops, args.batch)
+        store = OfflineStore(wal_dir)
+        wal = _run(store, args.ops, args.batch)
+        store.close()
+
+    print(f"{args.ops} ops, bloques de {args.batch}")
+    print(f"{'':10}{'enqueue ops/s':>16}{'drain ops/s':>16}")
+    print(f"{'antes':10}{legacy[0]:>16.0f}{legacy[1]:>16.0f}")
+    print(f"{'después':10}{wal[0]:>16.0f}{wal[1]:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Re-encola en la cola offline lo guardado en la bitácora de respaldo.
+
+Lee app/data/backups/journal_YYYY-MM-DD.ndjson.gz y vuelve a meter cada
+operación a app/data/offline.db; el sync del POS las reenvía. Es seguro
+repetirlo: lo que ya está en la cola se salta y el reenvío es idempotente.
+
+    python scripts/restore_backup.py --desde 2026-03-01 --hasta 2026-03-07
+    python scripts/restore_backup.py --listar
+"""
+import argparse
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "app")))
+
+from services.offline_store import OfflineStore  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--desde", type=date.fromisoformat, default=None, help="YYYY-MM-DD")
+    parser.add_argument("--hasta", type=date.fromisoformat, default=None, help="YYYY-MM-DD")
+    parser.add_argument("--listar", action="store_true", help="Sólo muestra los archivos y cuántas ops tiene cada uno")
+    args = parser.parse_args()
+
+    store = OfflineStore(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "app")))
+    if args.listar:
+        for path in store.journal.files(args.desde, args.hasta):
+            n = sum(1 for _ in store.journal.read_file(path))
+            print(f"{os.path.basename(path)}  {n} ops  {os.path.getsize(path)} bytes")
+        return
+
+    restored = store.restore_backup(args.desde, args.hasta)
+    print(f"{restored} operaciones re-encoladas ({store.count_ops()} pendientes en total)")
+
+
+if __name__ == "__main__":
+    main()
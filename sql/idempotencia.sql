@@ -0,0 +1,10 @@
+-- Llaves generadas en la caja (UUIDv7) para que reenviar la cola offline sea
+-- idempotente. comandas, gastos, propinas y cierres_caja ya tienen id uuid y
+-- el cliente lo manda explícito (upsert on_conflict=id). comanda_items usa id
+-- bigint, así que gana una columna uid única como llave de upsert.
+
+ALTER TABLE public.comanda_items
+  ADD COLUMN IF NOT EXISTS uid uuid NOT NULL DEFAULT gen_random_uuid();
+
+CREATE UNIQUE INDEX IF NOT EXISTS comanda_items_uid_key
+  ON public.comanda_items (uid);
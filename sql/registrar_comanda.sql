@@ -0,0 +1,72 @@
+-- Registra una comanda completa (encabezado, items y propina) en una sola
+-- transacción y un solo round trip. Los ids vienen de la caja (UUIDv7, ver
+-- idempotencia.sql), así que volver a llamarla con el mismo JSON no duplica.
+--
+-- p_comanda:
+-- {
+--   "id": uuid, "mesero": text, "metodo_pago": text, "total": numeric,
+--   "recibido": numeric|null, "cambio": numeric|null,
+--   "items": [{"uid": uuid, "producto_id": bigint, "nombre_snapshot": text,
+--              "precio_unitario": numeric, "cantidad": int, "subtotal": numeric}],
+--   "propina": {"id": uuid, "monto": numeric, "mesero_nombre_snapshot": text} | null
+-- }
+
+CREATE OR REPLACE FUNCTION public.registrar_comanda(p_comanda jsonb)
+RETURNS SETOF public.comandas
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_id uuid := (p_comanda->>'id')::uuid;
+  v_propina jsonb := p_comanda->'propina';
+BEGIN
+  INSERT INTO public.comandas (id, mesero, metodo_pago, total, recibido, cambio, status)
+  VALUES (
+    v_id,
+    p_comanda->>'mesero',
+    p_comanda->>'metodo_pago',
+    (p_comanda->>'total')::numeric,
+    (p_comanda->>'recibido')::numeric,
+    (p_comanda->>'cambio')::numeric,
+    COALESCE(p_comanda->>'status', 'PAGADA')
+  )
+  ON CONFLICT (id) DO NOTHING;
+
+  INSERT INTO public.comanda_items (uid, comanda_id, producto_id, nombre_snapshot, precio_unitario, cantidad, subtotal)
+  SELECT
+    (it->>'uid')::uuid,
+    v_id,
+    (it->>'producto_id')::bigint,
+    it->>'nombre_snapshot',
+    (it->>'precio_unitario')::numeric,
+    (it->>'cantidad')::integer,
+    (it->>'subtotal')::numeric
+  FROM jsonb_array_elements(COALESCE(p_comanda->'items', '[]'::jsonb)) AS it
+  ON CONFLICT (uid) DO NOTHING;
+
+  IF jsonb_typeof(v_propina) = 'object' THEN
+    INSERT INTO public.propinas (id, monto, mesero_id, mesero_nombre_snapshot, fuente, comanda_id)
+    VALUES (
+      (v_propina->>'id')::uuid,
+      (v_propina->>'monto')::numeric,
+      NULL,
+      v_propina->>'mesero_nombre_snapshot',
+      'COMANDA',
+      v_id
+    )
+    ON CONFLICT (id) DO NOTHING;
+  END IF;
+
+  RETURN QUERY SELECT * FROM public.comandas WHERE id = v_id;
+END;
+$$;
+
+-- Variante por bloques para el reenvío de la cola offline: un arreglo de
+-- p_comanda, todo en la misma transacción.
+CREATE OR REPLACE FUNCTION public.registrar_comandas(p_comandas jsonb)
+RETURNS SETOF public.comandas
+LANGUAGE sql
+AS $$
+  SELECT r.*
+  FROM jsonb_array_elements(p_comandas) AS c,
+       LATERAL public.registrar_comanda(c) AS r;
+$$;
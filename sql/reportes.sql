@@ -0,0 +1,29 @@
+-- Agregaciones de reportes que corren en Postgres para no bajar filas crudas
+-- ni mandar listas de ids en la URL.
+
+-- Top productos en un rango [p_desde, p_hasta] de comandas.created_at.
+-- p_limit <= 0 regresa todos.
+CREATE OR REPLACE FUNCTION public.top_productos(
+  p_desde timestamptz,
+  p_hasta timestamptz,
+  p_limit integer DEFAULT 10
+)
+RETURNS TABLE (producto text, cantidad_total bigint, subtotal_total numeric)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT
+    COALESCE(ci.nombre_snapshot, 'SIN_NOMBRE') AS producto,
+    SUM(ci.cantidad)::bigint AS cantidad_total,
+    SUM(ci.subtotal) AS subtotal_total
+  FROM public.comanda_items ci
+  JOIN public.comandas c ON c.id = ci.comanda_id
+  WHERE c.created_at >= p_desde
+    AND c.created_at <= p_hasta
+  GROUP BY 1
+  ORDER BY subtotal_total DESC, producto
+  LIMIT CASE WHEN p_limit > 0 THEN p_limit END;
+$$;
+
+CREATE INDEX IF NOT EXISTS comandas_created_at_idx ON public.comandas (created_at);
+CREATE INDEX IF NOT EXISTS comanda_items_comanda_id_idx ON public.comanda_items (comanda_id);
@@ -22,6 +22,7 @@ CREATE TABLE public.comanda_items (
   precio_unitario numeric NOT NULL CHECK (precio_unitario >= 0::numeric),
   cantidad integer NOT NULL CHECK (cantidad > 0),
   subtotal numeric NOT NULL CHECK (subtotal >= 0::numeric),
+  uid uuid NOT NULL DEFAULT gen_random_uuid() UNIQUE,
   CONSTRAINT comanda_items_pkey PRIMARY KEY (id),
   CONSTRAINT comanda_items_comanda_id_fkey FOREIGN KEY (comanda_id) REFERENCES public.comandas(id),
   CONSTRAINT comanda_items_producto_id_fkey FOREIGN KEY (producto_id) REFERENCES public.productos(id)